@@ -0,0 +1,141 @@
+import micropython
+from _thread import allocate_lock
+from time import sleep
+from mytools import thread, zeros, Rate
+
+
+class ActuatorLoop:
+    """
+    ActuatorLoop class
+    Updates every registered motor from a single thread.
+    Each pass reads all the speeds, computes all the FF and P duty cycles,
+    then writes all of them, so all the motors are updated at the same instant.
+    Duty cycle writes of coalesced motors are deferred to the end of the pass,
+    so a motor gets at most one write per period.
+    Motors can be registered and unregistered while the loop runs.
+    Parameters:
+        period: float - Update period in seconds
+    """
+
+    def __init__(self, period: float):
+
+        self.rate = Rate(period)
+
+        self.lock = allocate_lock()
+        # (motors, speeds, duties), replaced as a whole on register and unregister
+        self.state = ((), zeros(0), zeros(0))
+        self.writers = ()
+
+        self.run = False
+        self.running = False
+
+    def register(self, motor: object) -> None:
+        """
+        Registers a motor, the loop drives it from its speed_sp and acc_sp.
+        The motor's writes are coalesced.
+        Parameters:
+            motor: Motor
+        """
+        self.coalesce(motor)
+        with self.lock:
+            motors = self.state[0]
+            if motor not in motors:
+                motors = motors + (motor,)
+                self.state = (motors, zeros(len(motors)), zeros(len(motors)))
+
+    def unregister(self, motor: object) -> None:
+        """
+        Unregisters a motor.
+        The loop does not drive the motor once this returns,
+        its writes are still coalesced.
+        Parameters:
+            motor: Motor
+        """
+        with self.lock:
+            motors = tuple(m for m in self.state[0] if m is not motor)
+            self.state = (motors, zeros(len(motors)), zeros(len(motors)))
+
+    def coalesce(self, motor: object) -> None:
+        """
+        Coalesces the duty cycle writes of a motor,
+        they are written once per pass while the loop runs.
+        Parameters:
+            motor: Motor
+        """
+        with self.lock:
+            if motor not in self.writers:
+                self.writers = self.writers + (motor,)
+            motor.writeBehind = self.running
+
+    @micropython.native
+    def start(self) -> None:
+        """
+        Starts the loop thread if it is not running.
+        """
+        if self.running:
+            return
+        self.run = True
+        self.running = True
+        with self.lock:
+            for motor in self.writers:
+                motor.writeBehind = True
+        self.loop()
+
+    @micropython.native
+    @thread
+    def loop(self) -> None:
+        """
+        Actuator loop.
+        Runs as thread.
+        A failed pass stops the registered motors and exits the loop, so start can restart it.
+        """
+        lock = self.lock
+
+        self.rate.reset()
+        try:
+            while self.run:
+
+                with lock:
+                    motors, speeds, duties = self.state
+                    count = len(motors)
+
+                    for i in range(count):
+                        speeds[i] = motors[i].getSpeed()
+                    for i in range(count):
+                        motor = motors[i]
+                        duties[i] = motor.control(motor.speed_sp, motor.acc_sp, speeds[i])
+                    for i in range(count):
+                        motors[i].dutyCycle(duties[i])
+
+                    for motor in self.writers:
+                        motor.flush()
+
+                self.rate.wait()
+        except Exception as e:
+            print("Actuator loop failed:", e)
+            self.run = False
+            with lock:
+                for motor in self.state[0]:
+                    motor.stop()
+        finally:
+            with lock:
+                for motor in self.writers:
+                    motor.writeBehind = False
+                    motor.flush()
+            self.running = False
+
+    @micropython.native
+    def stop(self) -> None:
+        """
+        Stops the loop thread and waits for it to exit.
+        Pending writes are written before it exits.
+        """
+        self.run = False
+        while self.running:
+            sleep(0.001)
+
+    def __repr__(self):
+        writes = sum(motor.writes for motor in self.writers)
+        saved = sum(motor.saved for motor in self.writers)
+        return "writes: {} saved: {} ({:.0f}%)".format(
+            writes, saved, saved / (writes + saved) * 100 if writes + saved else 0)
@@ -1,6 +1,8 @@
 import micropython
 from time import time
 from math import pi, sin, cos, sqrt
+from mytools import zeros
+from kernels import ramsete, ramseteFF, B, ZETA, HALFDBM, SCALE
 
 
 class PIDController:
@@ -90,14 +92,20 @@ class RAMSETEController:
         b: float - Beta
         zeta: float - Zeta
         halfDBM: float - Half of the DBM
+        circumference: float - Wheel circumference, for the feedforward hot path
     """
-    def __init__(self, b: float, zeta: float, halfDBM: float):
+    def __init__(self, b: float, zeta: float, halfDBM: float, circumference: float = 360):
 
         self.b = b
         self.zeta = zeta
 
         self.halfDBM = micropython.const(halfDBM)
 
+        # (b, zeta, halfDBM, cm to deg) for the kernels hot path
+        self.gains = zeros(4)
+        self.gains[B], self.gains[ZETA], self.gains[HALFDBM] = b, zeta, halfDBM
+        self.gains[SCALE] = 360/circumference
+
     @micropython.native
     def correction(self, Vx: float, Vy: float, theata: float, V: float, Omega: float, theata_d: float) -> [float, float]:
         """
@@ -133,6 +141,29 @@ class RAMSETEController:
 
         return v - Omega, v + Omega
 
+    @micropython.native
+    def correctionInto(self, pose: object, target: object, out: object) -> None:
+        """
+        Calculate the correction value without allocating a result.
+        Parameters:
+            pose: array - Current (x, y, theata)
+            target: array - Trajectory sample, see TrajectorySampler.state
+            out: array - [leftCorr, rightCorr] are written to out[0], out[1]
+        """
+        ramsete(self.gains, pose, target, out)
+
+    @micropython.native
+    def feedforwardInto(self, pose: object, target: object, out: object) -> None:
+        """
+        Calculate the correction value on a sample with precomputed feedforward.
+        Parameters:
+            pose: array - Current (x, y, theata)
+            target: array - Trajectory sample, see TrajectorySampler.state
+            out: array - [leftCorr, rightCorr] in cm are written to out[0], out[1],
+                [leftSpeed, rightSpeed] in motor degrees to out[2], out[3]
+        """
+        ramseteFF(self.gains, pose, target, out)
+
     @micropython.native
     def setGains(self, b: float, zeta: float) -> None:
         """
@@ -143,3 +174,4 @@ class RAMSETEController:
         """
         self.b = b
         self.zeta = zeta
+        self.gains[B], self.gains[ZETA] = b, zeta
@@ -8,8 +8,11 @@ class DriveBase:
     Used to control the drivebase.
     Parameters:
         config: object
+        actuators: ActuatorLoop - Drives the motors
     """
-    def __init__(self, config: object):
+    def __init__(self, config: object, actuators: object):
+
+        self.actuators = actuators
 
         self.lm = Motor(config.drivebase.motor.left)
         self.rm = Motor(config.drivebase.motor.right)
@@ -50,22 +53,36 @@ class DriveBase:
         self.rm.run(self.motorSpeed(Vr), self.motorSpeed(Ar))
 
     @micropython.native
-    def update(self) -> None:
+    def run_tankFF(self, Vl: float, Vr: float, ffL: float, ffR: float, dutyL: float, dutyR: float) -> None:
         """
-        PID controller for the motor speeds.
-        Update time: 10ms.
+        Run the drivebase at a given speed with a precomputed feedforward.
+        Parameters:
+            Vl: float - Left motor speed
+            Vr: float - Right motor speed
+            ffL: float - Left motor feedforward speed
+            ffR: float - Right motor feedforward speed
+            dutyL: float - Left motor feedforward duty cycle
+            dutyR: float - Right motor feedforward duty cycle
         """
+        self.lm.runFF(Vl, ffL, dutyL)
+        self.rm.runFF(Vr, ffR, dutyR)
 
-        self.lm.update()
-        self.rm.update()
+    @micropython.native
+    def update(self) -> None:
+        """
+        Registers the motors in the actuator loop and starts it.
+        """
+        self.actuators.register(self.lm)
+        self.actuators.register(self.rm)
+        self.actuators.start()
 
     @micropython.native
     def stopUpdate(self) -> None:
         """
-        Stops the PID controller.
+        Unregisters the motors from the actuator loop.
         """
-        self.lm.stopUpdate()
-        self.rm.stopUpdate()
+        self.actuators.unregister(self.lm)
+        self.actuators.unregister(self.rm)
 
     @micropython.native
     def stop(self) -> None:
@@ -1,9 +1,19 @@
 import micropython
 from os import listdir
 from time import time, sleep
-from math import copysign
-from mytools import thread, sign
+from mytools import sign, zeros, ticks_us, ticks_diff
+from sysfs import SysfsReader, SysfsWriter, dutyBytes
 
+try:
+    from os import getenv
+except ImportError:
+    def getenv(key: str) -> str: return None
+
+# Sysfs root, EV3_SYSFS_ROOT points the devices at a fake sysfs tree (Tools/fakeSysfs.py)
+ROOT = getenv("EV3_SYSFS_ROOT") or ""
+TACHO_MOTOR = ROOT + "/sys/class/tacho-motor/"
+LEGO_SENSOR = ROOT + "/sys/class/lego-sensor/"
+IIO = ROOT + "/sys/bus/iio/devices/iio:device1/"
 
 motor_ports = {'A': ['0', None], 'B': ['1', None], 'C': ['2', None], 'D': ['3', None]}
 sensor_ports = {'1': None, '2': None, '3': None, '4': None}
@@ -32,23 +42,41 @@ class Motor:
 
         self.dir = micropython.const(config.direction)
 
-        self.countF = open("/sys/bus/iio/devices/iio:device1/in_count"+self._portProps[0]+"_raw", 'r')
-        self.frequencyF = open("/sys/bus/iio/devices/iio:device1/in_frequency"+self._portProps[0]+"_input", 'r')
-        self.dutyCycleF = open("/sys/class/tacho-motor/motor"+self._portProps[1]+"/duty_cycle_sp", 'w')
-        self.commandF = open("/sys/class/tacho-motor/motor"+self._portProps[1]+"/command", 'w')
+        self.countF = SysfsReader(IIO+"in_count"+self._portProps[0]+"_raw")
+        self.frequencyF = SysfsReader(IIO+"in_frequency"+self._portProps[0]+"_input")
+        self.dutyCycleF = SysfsWriter(TACHO_MOTOR+"motor"+self._portProps[1]+"/duty_cycle_sp")
+        self.commandF = SysfsWriter(TACHO_MOTOR+"motor"+self._portProps[1]+"/command")
 
         self.setCommand()
 
+        self.service = None
+        self.slot = 0
+
+        # Velocity estimator: gains (alpha, beta, gamma, kappa), state (angle, speed, acceleration)
+        self.gains = None
+        self.estimate = zeros(3)
+        self.stamp = None
+        # Shortest sample interval the estimator updates on in microseconds, half the sampling period
+        self.interval = 0
+
+        # Duty cycle write-behind, the bytes are entries of sysfs.DUTY so they compare by identity
+        self.writeBehind = False
+        self.pending = None
+        self.written = None
+        self.writes = 0
+        self.saved = 0
+
         self.bias = config.bias - self.count() / 2
 
         self.speed_sp = 0
         self.acc_sp = 0
+        # Precomputed feedforward, None when computed from speed_sp and acc_sp
+        self.ffSpeed_sp = 0
+        self.ffDuty_sp = None
 
         self.Kp = micropython.const(config.p)
         self.Ks, self.Kv, self.Ka = micropython.const(config.ff)
 
-        self._lastFrequency = 0
-
         for key, value in kwargs.items():
             setattr(self, key, value)
 
@@ -57,40 +85,50 @@ class Motor:
         """
         Runs the motor at a given speed and acceleration.
         Uses the ff values to calculate the duty cycle.
-        Needed to run Motor.update() to work.
+        Needs the motor to be registered in an ActuatorLoop to work.
         Parameters:
             speed: float
             acc: float
         """
         self.speed_sp = speed
         self.acc_sp = acc
+        self.ffDuty_sp = None
 
     @micropython.native
-    @thread
-    def update(self) -> None:
+    def runFF(self, speed: float, ffSpeed: float, ffDuty: float) -> None:
         """
-        FF and P controller for the motor speed.
-        Runs as thread.
-        Update time: 10ms.
+        Runs the motor at a given speed with a precomputed feedforward.
+        ffDuty must be Ks*sign(ffSpeed) + Kv*ffSpeed + Ka*acc, the P term
+        and the difference between speed and ffSpeed are added on top.
+        Needs the motor to be registered in an ActuatorLoop to work.
+        Parameters:
+            speed: float
+            ffSpeed: float - Speed the feedforward was computed for
+            ffDuty: float - Feedforward duty cycle
         """
-
-        self.runUpdate = True
-        while self.runUpdate:
-
-            if self.speed_sp != 0:
-                speed = self.speed_sp + self.Kp*(self.speed_sp - self.getSpeed())
-                self.dutyCycle(self.Ks*sign(speed) + self.Kv*speed + self.Ka*self.acc_sp)
-            else:
-                self.dutyCycle(0)
-
-            sleep(0.01)
+        self.speed_sp = speed
+        self.ffSpeed_sp = ffSpeed
+        self.ffDuty_sp = ffDuty
 
     @micropython.native
-    def stopUpdate(self) -> None:
+    def control(self, speed: float, acc: float, measured: float) -> float:
         """
-        Stops the update thread.
+        FF and P controller for the motor speed.
+        Parameters:
+            speed: float - Target speed
+            acc: float - Target acceleration
+            measured: float - Measured speed
+        Returns:
+            dutyCycle: float
         """
-        self.runUpdate = False
+        if speed == 0:
+            return 0
+        speed += self.Kp*(speed - measured)
+        ffDuty = self.ffDuty_sp
+        if ffDuty is None:
+            return self.Ks*sign(speed) + self.Kv*speed + self.Ka*acc
+        ffSpeed = self.ffSpeed_sp
+        return ffDuty + self.Kv*(speed - ffSpeed) + self.Ks*(sign(speed) - sign(ffSpeed))
 
     @micropython.native
     def runImmediate(self, speed: float = 0, acc: float = 0) -> None:
@@ -102,11 +140,7 @@ class Motor:
             speed: float
             acc: float
         """
-        if speed != 0:
-            speed += self.Kp*(speed - self.getSpeed())
-            self.dutyCycle(self.Ks*sign(speed) + self.Kv*speed + self.Ka*acc)
-        else:
-            self.dutyCycle(0)
+        self.dutyCycle(self.control(speed, acc, self.getSpeed()))
 
     @micropython.native
     def stop(self) -> None:
@@ -115,6 +149,7 @@ class Motor:
         """
         self.speed_sp = 0
         self.acc_sp = 0
+        self.ffDuty_sp = None
         self.dutyCycle(0)
 
     @micropython.native
@@ -139,10 +174,40 @@ class Motor:
     def getSpeed(self) -> float:
         """
         Returns the speed of the motor in degrees per second.
+        Filtered by the velocity estimator when attached to a sensor service that has one.
         Returns:
             speed: float
         """
-        return self.frequency() / 2
+        if self.gains is None:
+            return self.frequency() / 2
+        return self.service.value(self.slot+2)
+
+    @micropython.native
+    def waitSample(self, seq: int = 0) -> int:
+        """
+        Waits for a new reading.
+        Waits for a new sensor service snapshot when attached, sleeps a sample period otherwise.
+        Parameters:
+            seq: int - Last seen snapshot sequence number
+        Returns:
+            seq: int - Newest snapshot sequence number
+        """
+        if self.service is None:
+            sleep(0.005)
+            return seq
+        return self.service.wait(seq)
+
+    @micropython.native
+    def getAcceleration(self) -> float:
+        """
+        Returns the acceleration of the motor in degrees per second squared.
+        Needs the velocity estimator, returns 0 without it.
+        Returns:
+            acceleration: float
+        """
+        if self.gains is None:
+            return 0
+        return self.service.value(self.slot+3)
 
     @micropython.native
     def reset(self, bias: float = 0) -> None:
@@ -157,24 +222,126 @@ class Motor:
     def count(self) -> int:
         """
         Returns the count of the motor.
+        Read from the sensor service snapshot when attached.
         Returns:
             count: int
         """
-        self.countF.seek(0)
-        return int(self.countF.read()) * self.dir
+        if self.service is None:
+            return self.readCount()
+        return int(self.service.value(self.slot))
 
     @micropython.native
     def frequency(self) -> int:
         """
         Returns the frequency of the motor.
+        Read from the sensor service snapshot when attached.
         Returns:
             frequency: int
         """
-        self.frequencyF.seek(0)
-        data = self.frequencyF.read()
-        if data.strip().lstrip("-").isdigit():
-            self._lastFrequency = data
-        return int(self._lastFrequency) * self.dir
+        if self.service is None:
+            return self.readFrequency()
+        return int(self.service.value(self.slot+1))
+
+    @micropython.native
+    def attach(self, service: object) -> None:
+        """
+        Attaches the motor to a sensor service.
+        Uses the service's velocity estimator gains if it has them.
+        Parameters:
+            service: SensorService
+        """
+        estimator = service.estimator
+        if estimator is not None:
+            self.gains = zeros(4)
+            self.gains[0], self.gains[1] = estimator.alpha, estimator.beta
+            self.gains[2], self.gains[3] = estimator.gamma, estimator.kappa
+            self.interval = service.rate.period // 2
+        self.slot = service.allocate(self, 2 if estimator is None else 4)
+        self.service = service
+
+    @micropython.native
+    def sample(self, buffer: object) -> None:
+        """
+        Reads the count and the frequency into a snapshot buffer,
+        and the estimated speed and acceleration when estimating.
+        Parameters:
+            buffer: array
+        """
+        count = self.readCount()
+        frequency = self.readFrequency()
+        buffer[self.slot] = count
+        buffer[self.slot+1] = frequency
+
+        if self.gains is not None:
+            stamp = ticks_us()
+            self.estimateSpeed(count / 2, frequency / 2, stamp)
+            buffer[self.slot+2] = self.estimate[1]
+            buffer[self.slot+3] = self.estimate[2]
+
+    @micropython.native
+    def estimateSpeed(self, angle: float, speed: float, stamp: int) -> None:
+        """
+        Alpha-beta-gamma filter on the encoder angle,
+        the speed is then blended with the tacho frequency.
+        Samples closer than half the sampling period to the last update are skipped,
+        the next sample covers their interval, as the gains divided by a short dt blow up.
+        Parameters:
+            angle: float - Measured angle in degrees
+            speed: float - Measured speed in degrees per second
+            stamp: int - Measurement time in microseconds (ticks_us)
+        """
+        estimate, gains = self.estimate, self.gains
+
+        if self.stamp is None:
+            estimate[0], estimate[1], estimate[2] = angle, speed, 0
+            self.stamp = stamp
+            return
+
+        interval = ticks_diff(stamp, self.stamp)
+        if interval <= 0 or interval < self.interval:
+            return
+        self.stamp = stamp
+        dt = interval / 1000000
+
+        x, v, a = estimate[0], estimate[1], estimate[2]
+
+        # Predict
+        x += v*dt + a*dt*dt/2
+        v += a*dt
+
+        # Correct with the encoder
+        r = angle - x
+        x += gains[0]*r
+        v += gains[1]*r/dt
+        a += 2*gains[2]*r/(dt*dt)
+
+        # Blend with the tacho frequency
+        v += gains[3]*(speed - v)
+
+        # NaN or inf, restart from the measurement
+        if v - v != 0 or a - a != 0:
+            x, v, a = angle, speed, 0
+
+        estimate[0], estimate[1], estimate[2] = x, v, a
+
+    @micropython.native
+    def readCount(self) -> int:
+        """
+        Reads the count of the motor.
+        Returns:
+            count: int
+        """
+        return self.countF.read() * self.dir
+
+    @micropython.native
+    def readFrequency(self) -> int:
+        """
+        Reads the frequency of the motor.
+        Invalid reads return the last valid frequency.
+        Returns:
+            frequency: int
+        """
+        return self.frequencyF.read() * self.dir
 
     @micropython.native
     def dutyCycle(self, dutyCycle: int) -> None:
@@ -182,15 +349,40 @@ class Motor:
         Sets the duty cycle of the motor.
         Duty cycle is a value between -100 and 100 but
             function will limit it to that range.
+        Writes of the current value are suppressed.
+        With write-behind on, the value is written on the next flush,
+            so several changes within a period cost one write.
         Parameters:
             dutyCycle: int
         """
-        self.dutyCycleF.seek(0)
-        if abs(dutyCycle) <= 100:
-            self.dutyCycleF.write(str(int(dutyCycle)))
-        else:
-            self.dutyCycleF.write(str(int(copysign(100, dutyCycle))))
-        self.dutyCycleF.flush()
+        data = dutyBytes(dutyCycle)
+        if data is self.pending:
+            self.saved += 1
+            return
+        if self.writeBehind:
+            if self.pending is not self.written:
+                # Replaces a value that was never written
+                self.saved += 1
+            self.pending = data
+            return
+        self.pending = data
+        if data is self.written:
+            self.saved += 1
+            return
+        self.dutyCycleF.write(data)
+        self.written = data
+        self.writes += 1
+
+    @micropython.native
+    def flush(self) -> None:
+        """
+        Writes the pending duty cycle if it was not written yet.
+        """
+        data = self.pending
+        if data is not None and data is not self.written:
+            self.dutyCycleF.write(data)
+            self.written = data
+            self.writes += 1
 
     @micropython.native
     def setCommand(self, command: str = "run-direct"):
@@ -199,9 +391,7 @@ class Motor:
         Parameters:
             command: str
         """
-        self.commandF.seek(0)
-        self.commandF.write(command)
-        self.commandF.flush()
+        self.commandF.write(command.encode())
 
     @micropython.native
     def analysis(self, save: bool = True, filename: str = 'analysis.log') -> tuple:
@@ -223,7 +413,9 @@ class Motor:
 
             loopT = time()
             while time() - loopT < 0.5:
-                data.append([time() - st, duty, self.getSpeed()])
+                # Unfiltered speed, the FF fit needs the raw response
+                data.append([time() - st, duty, self.readFrequency() / 2])
+                sleep(0.005)
 
         self.dutyCycle(0)
 
@@ -241,7 +433,7 @@ class Motor:
             connected: bool
         """
         try:
-            with open("/sys/class/tacho-motor/motor"+self._portProps[1]+"/address", 'r'):
+            with open(TACHO_MOTOR+"motor"+self._portProps[1]+"/address", 'r'):
                 return True
         except Exception:
             return False
@@ -250,8 +442,10 @@ class Motor:
 class Gyro:
     """
     This class is used to control a gyro sensor.
+    In GYRO-G&A mode the angle and the rate are read together,
+    so the rate is available without switching modes.
     Parameters:
-        config: object
+        config: object - port, direction, bias, mode (optional, GYRO-ANG or GYRO-G&A)
         kwargs: dict
     """
 
@@ -265,14 +459,19 @@ class Gyro:
 
         self.dir = micropython.const(config.direction)
 
-        self.valueF = open("/sys/class/lego-sensor/sensor"+self._portF+"/value0", 'r')
-        self.modeF = open("/sys/class/lego-sensor/sensor"+self._portF+"/mode", 'w')
+        self._mode = micropython.const(config.mode if hasattr(config, 'mode') else "GYRO-ANG")
+        self.dual = self._mode == "GYRO-G&A"
+
+        self.valueF = SysfsReader(LEGO_SENSOR+"sensor"+self._portF+"/value0")
+        self.rateF = SysfsReader(LEGO_SENSOR+"sensor"+self._portF+"/value1")
+        self.modeF = SysfsWriter(LEGO_SENSOR+"sensor"+self._portF+"/mode")
 
         self.setMode()
 
-        self.bias = config.bias - self.read()
+        self.service = None
+        self.slot = 0
 
-        self._lastData = 0
+        self.bias = config.bias - self.read()
 
         for key, value in kwargs.items():
             setattr(self, key, value)
@@ -301,12 +500,15 @@ class Gyro:
     def getSpeed(self) -> float:
         """
         Returns the speed of the gyro in degrees per second.
+        Without GYRO-G&A mode the gyro switches modes to read it.
         Returns:
             speed: float
         """
+        if self.dual:
+            return self.rate()
         self.setMode("GYRO-RATE")
-        val = self.read()
-        self.setMode("GYRO-ANG")
+        val = self.readValue()
+        self.setMode()
         return val
 
     @micropython.native
@@ -328,32 +530,84 @@ class Gyro:
         """
         self.setMode("GYRO-CAL")
         sleep(2)
-        self.setMode("GYRO-ANG")
+        self.setMode()
         self.reset(angle)
 
     @micropython.native
     def read(self) -> int:
         """
         Returns the value currently reading.
+        Read from the sensor service snapshot when attached.
+        Returns:
+            value: int
+        """
+        if self.service is None:
+            return self.readValue()
+        return int(self.service.value(self.slot))
+
+    @micropython.native
+    def rate(self) -> int:
+        """
+        Returns the rate currently reading, needs GYRO-G&A mode.
+        Read from the sensor service snapshot when attached.
+        Returns:
+            rate: int
+        """
+        if self.service is None:
+            return self.readRate()
+        return int(self.service.value(self.slot+1))
+
+    @micropython.native
+    def attach(self, service: object) -> None:
+        """
+        Attaches the gyro to a sensor service.
+        Parameters:
+            service: SensorService
+        """
+        self.slot = service.allocate(self, 2 if self.dual else 1)
+        self.service = service
+
+    @micropython.native
+    def sample(self, buffer: object) -> None:
+        """
+        Reads the value, and the rate in GYRO-G&A mode, into a snapshot buffer.
+        Parameters:
+            buffer: array
+        """
+        buffer[self.slot] = self.readValue()
+        if self.dual:
+            buffer[self.slot+1] = self.readRate()
+
+    @micropython.native
+    def readValue(self) -> int:
+        """
+        Reads the value of the sensor.
+        Invalid reads return the last valid value.
         Returns:
             value: int
         """
-        self.valueF.seek(0)
-        data = self.valueF.read()
-        if data.strip().lstrip("-").isdigit():
-            self._lastData = data
-        return int(self._lastData) * self.dir
+        return self.valueF.read() * self.dir
+
+    @micropython.native
+    def readRate(self) -> int:
+        """
+        Reads the rate of the sensor, needs GYRO-G&A mode.
+        Invalid reads return the last valid rate.
+        Returns:
+            rate: int
+        """
+        return self.rateF.read() * self.dir
 
     @micropython.native
-    def setMode(self, mode: str = "GYRO-ANG") -> None:
+    def setMode(self, mode: str = None) -> None:
         """
         Sets the mode of the gyro.
         Parameters:
-            mode: str
+            mode: str - None sets the configured mode
         """
-        self.modeF.seek(0)
-        self.modeF.write(mode)
-        self.modeF.flush()
+        if mode is None:
+            mode = self._mode
+        self.modeF.write(mode.encode())
 
     @micropython.native
     def connected(self) -> bool:
@@ -363,7 +617,7 @@ class Gyro:
             connected: bool
         """
         try:
-            with open("/sys/class/lego-sensor/sensor"+self._portF+"/address", 'r'):
+            with open(LEGO_SENSOR+"sensor"+self._portF+"/address", 'r'):
                 return True
         except Exception:
             return False
@@ -437,6 +691,16 @@ class DualGyro(Gyro):
         self.gyro1.calibrate(angle)
         self.gyro2.calibrate(angle)
 
+    @micropython.native
+    def attach(self, service: object) -> None:
+        """
+        Attaches both gyros to a sensor service.
+        Parameters:
+            service: SensorService
+        """
+        self.gyro1.attach(service)
+        self.gyro2.attach(service)
+
     @micropython.native
     def connected(self) -> [bool, bool]:
         """
@@ -463,11 +727,14 @@ class LightSensor:
         if not self.connected():
             raise PortError(self._port)
 
-        self.valueF = open("/sys/class/lego-sensor/sensor"+self._portF+"/value0", 'r')
-        self.modeF = open("/sys/class/lego-sensor/sensor"+self._portF+"/mode", 'w')
+        self.valueF = SysfsReader(LEGO_SENSOR+"sensor"+self._portF+"/value0")
+        self.modeF = SysfsWriter(LEGO_SENSOR+"sensor"+self._portF+"/mode")
 
         self.setMode()
 
+        self.service = None
+        self.slot = 0
+
         for key, value in kwargs.items():
             setattr(self, key, value)
 
@@ -488,7 +755,7 @@ class LightSensor:
             color: int
         """
         self.setMode('COL-COLOR')
-        val = self.read()
+        val = self.readValue()
         self.setMode("COL-REFLECT")
         return val
 
@@ -496,11 +763,41 @@ class LightSensor:
     def read(self) -> int:
         """
         Returns the value currently reading.
+        Read from the sensor service snapshot when attached.
+        Returns:
+            value: int
+        """
+        if self.service is None:
+            return self.readValue()
+        return int(self.service.value(self.slot))
+
+    @micropython.native
+    def attach(self, service: object) -> None:
+        """
+        Attaches the light sensor to a sensor service.
+        Parameters:
+            service: SensorService
+        """
+        self.slot = service.allocate(self, 1)
+        self.service = service
+
+    @micropython.native
+    def sample(self, buffer: object) -> None:
+        """
+        Reads the value into a snapshot buffer.
+        Parameters:
+            buffer: array
+        """
+        buffer[self.slot] = self.readValue()
+
+    @micropython.native
+    def readValue(self) -> int:
+        """
+        Reads the value of the sensor.
         Returns:
             value: int
         """
-        self.valueF.seek(0)
-        return int(self.valueF.read())
+        return self.valueF.read()
 
     @micropython.native
     def setMode(self, mode: str = "COL-REFLECT") -> None:
@@ -509,9 +806,7 @@ class LightSensor:
         Parameters:
             mode: str
         """
-        self.modeF.seek(0)
-        self.modeF.write(mode)
-        self.modeF.flush()
+        self.modeF.write(mode.encode())
 
     @micropython.native
     def connected(self) -> bool:
@@ -521,7 +816,7 @@ class LightSensor:
             connected: bool
         """
         try:
-            with open("/sys/class/lego-sensor/sensor"+self._portF+"/address", 'r'):
+            with open(LEGO_SENSOR+"sensor"+self._portF+"/address", 'r'):
                 return True
         except Exception:
             return False
@@ -532,8 +827,8 @@ def MotorPorts() -> None:
     """
     Updates dict of motor ports.
     """
-    for dir in listdir("/sys/class/tacho-motor"):
-        with open("/sys/class/tacho-motor/"+dir+"/address", 'r') as f:
+    for dir in listdir(TACHO_MOTOR):
+        with open(TACHO_MOTOR+dir+"/address", 'r') as f:
             addr = f.read()
         motor_ports[addr[13]][1] = dir[5:]
 
@@ -543,8 +838,8 @@ def SensorPorts() -> None:
     """
     Updates dict of sensor ports.
     """
-    for dir in listdir("/sys/class/lego-sensor"):
-        with open("/sys/class/lego-sensor/"+dir+"/address", 'r') as f:
+    for dir in listdir(LEGO_SENSOR):
+        with open(LEGO_SENSOR+dir+"/address", 'r') as f:
             addr = f.read()
         sensor_ports[addr[12]] = dir[6:]
 
@@ -16,11 +16,14 @@ class Motor(_Motor):
         bias: float
         speedKpid: [float, float, float]
         posKpid: [float, float, float]
+        pool: WorkerPool - Runs the wait=False commands
     """
 
+    pool = None
+
     def __init__(self, config, **kwargs):
 
-        super().__init__(config)
+        super().__init__(config, **kwargs)
 
         self.speedKpid = micropython.const(config.speedKpid)
         self.posKpid = micropython.const(config.posKpid)
@@ -49,12 +52,14 @@ class Motor(_Motor):
 
             st = time()
 
+            seq = self.waitSample()
             error = angle - self.getAngle()
             while not between(error, 0, range) and time() - st < timeout:
 
                 while not between(error, 0, range) and time() - st < timeout:
                     error = angle - self.getAngle()
                     self.runImmediate(PID.correction(None, error) + copysign(speed, error))
+                    seq = self.waitSample(seq)
 
                 self.stop()
 
@@ -64,7 +69,7 @@ class Motor(_Motor):
         if wait:
             main(self, angle, Kpid, speed, timeout, range)
         else:
-            thread(main)(self, angle, Kpid, speed, timeout, range)
+            return self.background(main, self, angle, Kpid, speed, timeout, range)
 
     @micropython.native
     def Turn(self, angle: float, Kpid: [float, float, float] = None, speed: float = 0,
@@ -79,7 +84,7 @@ class Motor(_Motor):
             wait: bool
             range: float
         """
-        self.TurnABS(self.getAngle() + angle, Kpid, speed, timeout, wait, range)
+        return self.TurnABS(self.getAngle() + angle, Kpid, speed, timeout, wait, range)
 
     def RunTime(self, speed: float, time: float, wait: bool = True):
         """
@@ -99,4 +104,20 @@ class Motor(_Motor):
         if wait:
             main(speed, time)
         else:
-            thread(main)(speed, time)
+            return self.background(main, speed, time)
+
+    def background(self, func, *args):
+        """
+        Run a command in the background.
+        Uses the worker pool when the motor has one, the job belongs to the pool's current run
+        so exiting the run cancels it while it is queued.
+        Parameters:
+            func: function
+            args: tuple
+        Returns:
+            job: Job - Job handle, None without a worker pool
+        """
+        if self.pool is None:
+            thread(func)(*args)
+            return None
+        return self.pool.submit(func, args)
@@ -27,6 +27,8 @@ class Handler:
         self.ev3.screen.load_image(Image('/home/robot/Robot/Media/RunButtons.png'))
 
         self.runner.drivebase.update()
+        self.runner.actuators.register(self.runner.lm)
+        self.runner.actuators.register(self.runner.rm)
 
         lA = self.runner.lm.getAngle()
         rA = self.runner.rm.getAngle()
@@ -44,21 +46,23 @@ class Handler:
             pressed = self.ev3.buttons.pressed()
 
             sign = 1 if int(time()*5) % 2 == 0 else -1
-            self.runner.lm.runImmediate(200*sign + Kp*(lA - self.runner.lm.getAngle()))
-            self.runner.rm.runImmediate(200*sign + Kp*(rA - self.runner.rm.getAngle()))
+            self.runner.lm.run(200*sign + Kp*(lA - self.runner.lm.getAngle()))
+            self.runner.rm.run(200*sign + Kp*(rA - self.runner.rm.getAngle()))
 
             if pressed:
 
                 self.running = True
 
-                self.runner.lm.dutyCycle(0)
-                self.runner.rm.dutyCycle(0)
+                # Runs drive the attachment motors directly
+                self.runner.actuators.unregister(self.runner.lm)
+                self.runner.actuators.unregister(self.runner.rm)
+                self.runner.lm.stop()
+                self.runner.rm.stop()
 
                 if pressed[0] == Button.CENTER:
                     log, count = self.runner.path('1', 0.025, 0.5, True)
 
-                    with open('/home/robot/Logs/runtime1.log', 'w') as f:
-                        f.write(str(log))
+                    self.saveLogs('1', log)
                     print("Count 1:", count)
 
                     self.runner.preload('2')
@@ -66,8 +70,7 @@ class Handler:
                 elif pressed[0] == Button.UP:
                     log, count = self.runner.path('2', 0.025, 0.7, True)
 
-                    with open('/home/robot/Logs/runtime2.log', 'w') as f:
-                        f.write(str(log))
+                    self.saveLogs('2', log)
                     print("Count 2:", count)
 
                     self.runner.preload('3')
@@ -76,8 +79,7 @@ class Handler:
                     # 0.05, 0.6
                     log, count = self.runner.path('3', 0.05, 0.6, True)
 
-                    with open('/home/robot/Logs/runtime3.log', 'w') as f:
-                        f.write(str(log))
+                    self.saveLogs('3', log)
                     print("Count 3:", count)
 
                     self.running = False
@@ -96,8 +98,7 @@ class Handler:
                 elif pressed[0] == Button.DOWN:
                     log, count = self.runner.path('4', 0.02, 0.7, True)
 
-                    with open('/home/robot/Logs/runtime4.log', 'w') as f:
-                        f.write(str(log))
+                    self.saveLogs('4', log)
                     print("Count 4:", count)
 
                     self.runner.preload('5')
@@ -106,8 +107,7 @@ class Handler:
                     # log, count = self.runner.path('5', 0.035, 0.7, True)
                     log, count = self.runner.path('5', 0.02, 0.65, True)
 
-                    with open('/home/robot/Logs/runtime5.log', 'w') as f:
-                        f.write(str(log))
+                    self.saveLogs('5', log)
                     print("Count 5:", count)
 
                 self.running = False
@@ -115,8 +115,25 @@ class Handler:
                 rA = self.runner.rm.getAngle()
                 lA = self.runner.lm.getAngle()
 
+                self.runner.actuators.register(self.runner.lm)
+                self.runner.actuators.register(self.runner.rm)
+
                 sleep(1)
 
+            sleep(0.01)
+
+    def saveLogs(self, name: str, log: object):
+        """
+        Save the run log and the control loop latency of a path.
+        The run log is written in the background.
+        Parameters:
+            name: str - Path name
+            log: RunLog - Run log
+        """
+        log.dump('/home/robot/Logs/runtime'+name+'.log')
+        with open('/home/robot/Logs/latency'+name+'.log', 'w') as f:
+            f.write(self.runner.latency)
+
     @thread
     def startExit(self):
         """
@@ -0,0 +1,147 @@
+import micropython
+from math import pi, radians
+from mytools import zeros
+
+
+class HeadingEstimator:
+    """
+    HeadingEstimator class
+    Fuses the gyros with the yaw from the wheel encoders (complementary filter).
+    Every gyro's bias is estimated online against the encoder yaw.
+    With two gyros, a gyro that disagrees with the other and with the encoders
+    (drifting or stuck) is dropped until the next window.
+    Bias is only learned while the gyros and the encoders agree, so wheel slip does not bias it.
+    Gyro angles are whole degrees, so the gyros are compared over a window of ticks,
+    not tick by tick, and the thresholds include the one degree quantum.
+    Parameters:
+        drivebase: DriveBase object
+        config: object - Heading config (weight, bias, outlier, window)
+    """
+
+    def __init__(self, drivebase: object, config: object):
+
+        gyro = drivebase.gyro
+        self.gyros = (gyro.gyro1, gyro.gyro2) if hasattr(gyro, 'gyro1') else (gyro,)
+
+        # Wheel rotations difference to yaw in radians
+        self._k = micropython.const(drivebase._wheelCircumference/drivebase._DBM)
+        self._weight = micropython.const(config.weight)
+        self._biasGain = micropython.const(config.bias)
+        self._outlier = micropython.const(config.outlier)
+        self._window = micropython.const(config.window)
+        self._quantum = micropython.const(radians(1))
+
+        self.readings = zeros(len(self.gyros))
+        self.angles = zeros(len(self.gyros))
+        self.bias = zeros(len(self.gyros))
+        self.rates = zeros(len(self.gyros))
+        self.rejected = [0] * len(self.gyros)
+
+        # Window sums: gyro and encoder yaw, time
+        self.sums = zeros(len(self.gyros))
+        self.encoder = 0
+        self.elapsed = 0
+        # Gyro used until the next window, -1 for all
+        self.use = -1
+
+        self.theata = 0
+
+    @micropython.native
+    def reset(self, theata: float) -> None:
+        """
+        Resets the heading, call after the gyros were reset.
+        Parameters:
+            theata: float - Heading in radians
+        """
+        for i in range(len(self.gyros)):
+            self.angles[i] = radians(self.gyros[i].getAngle())
+            self.sums[i] = 0
+        self.encoder = 0
+        self.elapsed = 0
+        self.use = -1
+        self.theata = theata
+
+    @micropython.native
+    def sample(self) -> None:
+        """
+        Reads the gyro angles for the next update.
+        Call it with the encoder reads, so both come from the same snapshot.
+        """
+        for i in range(len(self.gyros)):
+            self.readings[i] = radians(self.gyros[i].getAngle())
+
+    @micropython.native
+    def update(self, dL: float, dR: float, dt: float) -> float:
+        """
+        Updates the heading from the gyro angles read by sample.
+        Parameters:
+            dL: float - Left wheel rotations since the last update
+            dR: float - Right wheel rotations since the last update
+            dt: float - Time since the last update in seconds
+        Returns:
+            theata: float - Heading in radians, [0, 2pi)
+        """
+        readings, angles, bias, rates, sums = self.readings, self.angles, self.bias, self.rates, self.sums
+        count = len(readings)
+
+        encoder = (dR - dL)*self._k
+        if dt <= 0:
+            dt = 1e-3
+
+        for i in range(count):
+            angle = readings[i]
+            rates[i] = angle - angles[i] - bias[i]*dt
+            angles[i] = angle
+            sums[i] += rates[i]
+        self.encoder += encoder
+        self.elapsed += dt
+
+        use = self.use
+        gyro = 0
+        used = 0
+        for i in range(count):
+            if use != -1 and i != use:
+                continue
+            gyro += rates[i]
+            used += 1
+        gyro /= used
+
+        if self.elapsed >= self._window:
+            self.check()
+
+        theata = self.theata + self._weight*gyro + (1 - self._weight)*encoder
+        if theata >= 2*pi: theata -= 2*pi
+        elif theata < 0: theata += 2*pi
+        self.theata = theata
+
+        return theata
+
+    @micropython.native
+    def check(self) -> None:
+        """
+        Ends a window: picks the gyros to use and learns their bias.
+        """
+        sums, bias = self.sums, self.bias
+        count = len(sums)
+        encoder, elapsed = self.encoder, self.elapsed
+
+        # Outlier rejection, only possible with a second gyro to compare against
+        use = -1
+        if count == 2 and abs(sums[0] - sums[1]) > self._outlier*elapsed + 2*self._quantum:
+            use = 0 if abs(sums[0] - encoder) < abs(sums[1] - encoder) else 1
+            self.rejected[1 - use] += 1
+
+        for i in range(count):
+            if use == -1 or i == use:
+                residual = sums[i] - encoder
+                if abs(residual) < self._outlier*elapsed + self._quantum:
+                    bias[i] += self._biasGain*residual/elapsed
+            sums[i] = 0
+
+        self.encoder = 0
+        self.elapsed = 0
+        self.use = use
+
+    def __repr__(self):
+        return "bias: {} rejected: {}".format(
+            [round(b, 5) for b in self.bias], self.rejected)
@@ -0,0 +1,127 @@
+import micropython
+from math import pi, sin, cos, sqrt
+
+# Trajectory sample layout, see TrajectorySampler.state
+X, Y, THEATA, V, OMEGA, ACCL, ACCR, SIN, COS, SPEEDL, SPEEDR, DUTYL, DUTYR = range(13)
+
+# RAMSETE gains layout, see RAMSETEController.gains
+B, ZETA, HALFDBM, SCALE = range(4)
+
+
+@micropython.native
+def ramsete(gains: object, pose: object, target: object, out: object) -> None:
+    """
+    RAMSETE control law.
+    Writes the left and right wheel speeds into out[0], out[1].
+    Parameters:
+        gains: array - (b, zeta, halfDBM)
+        pose: array - Current (x, y, theata)
+        target: array - Trajectory sample (x, y, theata, V, omega, ...)
+        out: array - Output, at least 2 values
+    """
+    theata = pose[2]
+    cosTheata, sinTheata = cos(theata), sin(theata)
+
+    Vx = target[X] - pose[0]
+    Vy = target[Y] - pose[1]
+    Ex = cosTheata*Vx + sinTheata*Vy
+    Ey = cosTheata*Vy - sinTheata*Vx
+
+    Etheata = target[THEATA] - theata
+    if Etheata > pi: Etheata -= 2*pi
+    elif Etheata < -pi: Etheata += 2*pi
+
+    b, velocity, omega = gains[B], target[V], target[OMEGA]
+    k = 2*gains[ZETA]*sqrt(omega*omega + b*velocity*velocity)
+
+    v = velocity*cos(Etheata) + k*Ex
+    if Etheata != 0:
+        omega += k*Etheata + (b*velocity*sin(Etheata)*Ey)/Etheata
+    else:
+        omega += b*velocity*Ey
+    omega *= gains[HALFDBM]
+
+    out[0] = v - omega
+    out[1] = v + omega
+
+
+@micropython.native
+def ramseteFF(gains: object, pose: object, target: object, out: object) -> None:
+    """
+    RAMSETE control law on a sample with precomputed feedforward.
+    Uses the sample's sin and cos, so only the heading error needs trig.
+    Writes the left and right wheel speeds into out[0], out[1]
+    and the feedforward speeds plus the correction, in motor degrees, into out[2], out[3].
+    Parameters:
+        gains: array - (b, zeta, halfDBM, scale)
+        pose: array - Current (x, y, theata)
+        target: array - Trajectory sample with the feedforward columns
+        out: array - Output, at least 4 values
+    """
+    Etheata = target[THEATA] - pose[2]
+    if Etheata > pi: Etheata -= 2*pi
+    elif Etheata < -pi: Etheata += 2*pi
+    cosE, sinE = cos(Etheata), sin(Etheata)
+
+    # theata = theata_d - Etheata
+    cosTheata = target[COS]*cosE + target[SIN]*sinE
+    sinTheata = target[SIN]*cosE - target[COS]*sinE
+
+    Vx = target[X] - pose[0]
+    Vy = target[Y] - pose[1]
+    Ex = cosTheata*Vx + sinTheata*Vy
+    Ey = cosTheata*Vy - sinTheata*Vx
+
+    b, velocity, omega, halfDBM = gains[B], target[V], target[OMEGA], gains[HALFDBM]
+    k = 2*gains[ZETA]*sqrt(omega*omega + b*velocity*velocity)
+
+    v = velocity*cosE + k*Ex
+    if Etheata != 0:
+        correction = k*Etheata + (b*velocity*sinE*Ey)/Etheata
+    else:
+        correction = b*velocity*Ey
+    Omega = (omega + correction)*halfDBM
+
+    out[0] = v - Omega
+    out[1] = v + Omega
+
+    # Feedback part only, the feedforward part is precomputed in degrees
+    dv = (v - velocity)*gains[SCALE]
+    dOmega = correction*halfDBM*gains[SCALE]
+    out[2] = target[SPEEDL] + dv - dOmega
+    out[3] = target[SPEEDR] + dv + dOmega
+
+
+@micropython.native
+def odometryStep(pose: object, dS: float, newTheata: float) -> None:
+    """
+    Odometry step, integrates with the midpoint heading.
+    Updates pose in place.
+    Parameters:
+        pose: array - (x, y, theata)
+        dS: float - Distance driven
+        newTheata: float - New heading in radians
+    """
+    dTheata = newTheata - pose[2]
+    if dTheata > pi: dTheata -= 2*pi
+    elif dTheata < -pi: dTheata += 2*pi
+    midTheata = pose[2] + dTheata/2
+
+    pose[0] += dS*cos(midTheata)
+    pose[1] += dS*sin(midTheata)
+    pose[2] = newTheata
+
+
+@micropython.native
+def cmToDeg(values: object, start: int, count: int, circumference: float) -> None:
+    """
+    Converts wheel speeds or accelerations from cm to motor degrees in place.
+    Parameters:
+        values: array
+        start: int - First value to convert
+        count: int - Number of values to convert
+        circumference: float - Wheel circumference
+    """
+    scale = 360/circumference
+    for i in range(start, start + count):
+        values[i] *= scale
@@ -0,0 +1,120 @@
+import micropython
+from _thread import allocate_lock
+from struct import calcsize, pack
+from mytools import thread, zeros
+
+
+# Binary run log format, little endian:
+#   Header: magic: 4s, version: H, columns: H, samples: I, dropped: I
+#   Data: columns of samples float32 values, oldest sample first
+#       time, spline, x, y, theata, speedL, speedR, Vl, Vr
+
+MAGIC = b'FLLL'
+VERSION = 1
+COLUMNS = ('time', 'spline', 'x', 'y', 'theata', 'speedL', 'speedR', 'Vl', 'Vr')
+HEADER = '<4sHHII'
+HEADER_SIZE = calcsize(HEADER)
+
+
+class RunLog:
+    """
+    RunLog class
+    Run log backed by preallocated float32 columns.
+    Works as a ring buffer, when it is full the oldest samples are overwritten.
+    Parameters:
+        capacity: int - Max samples
+    """
+
+    def __init__(self, capacity: int):
+
+        self.capacity = capacity
+        self.lock = allocate_lock()
+
+        self.columns = tuple(zeros(capacity) for _ in COLUMNS)
+        self.time, self.spline, self.x, self.y, self.theata, self.speedL, self.speedR, self.Vl, self.Vr = self.columns
+
+        self.head = 0
+        self.samples = 0
+        self.dropped = 0
+
+    @micropython.native
+    def reset(self) -> None:
+        """
+        Clears the log.
+        Waits for a running dump to finish.
+        """
+        with self.lock:
+            self.head = 0
+            self.samples = 0
+            self.dropped = 0
+
+    @micropython.native
+    def add(self, time: float, spline: int, x: float, y: float, theata: float,
+            speedL: float, speedR: float, Vl: float, Vr: float) -> None:
+        """
+        Adds a sample.
+        Parameters:
+            time: float - Path time
+            spline: int - Spline index
+            x: float
+            y: float
+            theata: float
+            speedL: float - Left motor speed
+            speedR: float - Right motor speed
+            Vl: float - Left speed setpoint
+            Vr: float - Right speed setpoint
+        """
+        head = self.head
+
+        self.time[head] = time
+        self.spline[head] = spline
+        self.x[head] = x
+        self.y[head] = y
+        self.theata[head] = theata
+        self.speedL[head] = speedL
+        self.speedR[head] = speedR
+        self.Vl[head] = Vl
+        self.Vr[head] = Vr
+
+        head += 1
+        if head == self.capacity:
+            head = 0
+        self.head = head
+
+        if self.samples < self.capacity:
+            self.samples += 1
+        else:
+            self.dropped += 1
+
+    @micropython.native
+    def dump(self, filename: str) -> None:
+        """
+        Writes the log in the binary run log format in the background.
+        The log is locked until it is written.
+        Parameters:
+            filename: str
+        """
+        self.lock.acquire()
+        self.write(filename)
+
+    @micropython.native
+    @thread
+    def write(self, filename: str) -> None:
+        """
+        Writes the locked log and unlocks it.
+        Runs as thread.
+        Parameters:
+            filename: str
+        """
+        try:
+            with open(filename, 'wb') as f:
+                f.write(pack(HEADER, MAGIC, VERSION, len(COLUMNS), self.samples, self.dropped))
+                for column in self.columns:
+                    data = memoryview(column)
+                    if self.samples == self.capacity:
+                        f.write(data[self.head:])
+                        f.write(data[:self.head])
+                    else:
+                        f.write(data[:self.samples])
+        finally:
+            self.lock.release()
@@ -1,7 +1,20 @@
 import micropython
+from array import array
+from struct import calcsize
 from _thread import start_new_thread
 from time import time as _time
 
+try:
+    from time import ticks_us, ticks_add, ticks_diff, sleep_us
+except ImportError:
+    # CPython
+    from time import perf_counter, sleep as _sleep
+
+    def ticks_us() -> int: return int(perf_counter()*1000000)
+    def ticks_add(ticks: int, delta: int) -> int: return ticks + delta
+    def ticks_diff(ticks1: int, ticks2: int) -> int: return ticks1 - ticks2
+    def sleep_us(us: int) -> None: _sleep(us/1000000)
+
 
 @micropython.native
 def mean(*args: float) -> float:
@@ -39,6 +52,22 @@ def sign(x: float) -> int:
     return x/abs(x)
 
 
+@micropython.native
+def zeros(size: int, typecode: str = 'f') -> array:
+    """
+    This function returns a preallocated array filled with zeros.
+    The array is built from raw bytes, so no value is boxed.
+
+    Parameters: size: int, typecode: str
+    Returns: array
+    """
+    try:
+        return array(typecode, bytearray(size*calcsize(typecode)))
+    except TypeError:
+        # CPython does not build typed arrays from bytes
+        return array(typecode, [0])*size
+
+
 @micropython.native
 def between(x: float, y: float, z: float):
     return abs(y-x) < z
@@ -47,13 +76,16 @@ def between(x: float, y: float, z: float):
 class Timer:
     def __init__(self):
         self.st = _time()
-        self.pt = _time()
+        self.pt = None
 
     @micropython.native
     def get(self):
         """
         Return current time.
+        The time does not advance while the timer is paused.
         """
+        if self.pt is not None:
+            return self.pt - self.st
         return _time() - self.st
 
     @micropython.native
@@ -62,6 +94,7 @@ class Timer:
         Resets timer.
         """
         self.st = _time()
+        self.pt = None
 
     @micropython.native
     def pause(self):
@@ -77,3 +110,54 @@ class Timer:
         """
         self.st += _time() - self.pt
         self.pt = None
+
+
+class Rate:
+    """
+    Runs a loop at a fixed period, using the monotonic microsecond clock.
+    Sleeps off the rest of every period, counts missed deadlines and measures jitter.
+    Parameters:
+        period: float - Period in seconds, 0 to free-run
+    """
+    def __init__(self, period: float):
+        self.period = int(period*1000000)
+        self.reset()
+
+    @micropython.native
+    def reset(self):
+        """
+        Starts a new period and resets the statistics.
+        """
+        self.deadline = ticks_add(ticks_us(), self.period)
+        self.ticks = 0
+        self.missed = 0
+        self.jitterSum = 0
+        self.jitterMax = 0
+
+    @micropython.native
+    def wait(self):
+        """
+        Sleeps until the end of the current period.
+        A missed deadline starts a new period instead of bursting to catch up.
+        """
+        if self.period == 0:
+            return
+
+        remaining = ticks_diff(self.deadline, ticks_us())
+        if remaining > 0:
+            sleep_us(remaining)
+            jitter = ticks_diff(ticks_us(), self.deadline)
+            self.deadline = ticks_add(self.deadline, self.period)
+        else:
+            self.missed += 1
+            jitter = -remaining
+            self.deadline = ticks_add(ticks_us(), self.period)
+
+        self.ticks += 1
+        self.jitterSum += jitter
+        if jitter > self.jitterMax:
+            self.jitterMax = jitter
+
+    def __repr__(self):
+        return "ticks: {} missed: {} jitter mean: {}us max: {}us".format(
+            self.ticks, self.missed, self.jitterSum // max(self.ticks, 1), self.jitterMax)
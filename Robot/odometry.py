@@ -1,67 +1,149 @@
 import micropython
-from _thread import LockType
-from math import sin, cos, radians, degrees
-from mytools import thread
+from math import pi, radians, degrees
+from time import sleep
+from mytools import thread, zeros, Rate, ticks_diff
+from heading import HeadingEstimator
+from kernels import odometryStep
 
 
 class DiffrentialDriveOdometry:
     """
     This class is used to calculate the odometry of a diffrential drive robot.
     Odometry is the use of data from motion sensors to estimate change in position over time.
+    Runs at a fixed rate on the sensor service snapshots and integrates with the midpoint heading.
+    The pose is published without locks, using a sequence counter (odd while writing),
+    and the last poses are kept with their snapshot timestamps.
+    The heading comes from the gyro, or from a HeadingEstimator fusing the gyros with the encoders.
     Parameters:
         drivebase: DriveBase object
-        lock: LockType object
+        sensors: SensorService object
+        config: object - Odometry config (period, history, heading)
         x: float
         y: float
         theata: float
     """
-    def __init__(self, drivebase: object, lock: LockType, x: float = 0, y: float = 0, theata: float = 0):
-
-        self.lock = lock
+    def __init__(self, drivebase: object, sensors: object, config: object,
+                 x: float = 0, y: float = 0, theata: float = 0):
 
         self.drivebase = drivebase
+        self.sensors = sensors
+
+        self.rate = Rate(config.period)
+
+        if config.heading.mode == "fused":
+            self.heading = HeadingEstimator(drivebase, config.heading)
+        else:
+            self.heading = None
 
-        self.x, self.y = x, y
-        self.theata = theata
+        self.pose = zeros(3)
+        self.seq = 0
+
+        self.history = config.history
+        self.times = [0] * self.history
+        self.xs = zeros(self.history)
+        self.ys = zeros(self.history)
+        self.theatas = zeros(self.history)
+        self.head = 0
+        self.samples = 0
 
         self.run = False
+        self.running = False
+
+        self.publish(x, y, theata, 0)
 
     @micropython.native
-    @thread
     def start(self) -> None:
         """
         Starts the odometry thread.
         """
         self.run = True
+        self.running = True
+        self.loop()
 
-        past_lm_pos, past_rm_pos = self.drivebase.getRot()
+    @micropython.native
+    @thread
+    def loop(self) -> None:
+        """
+        Odometry loop.
+        Runs as thread.
+        """
+        sensors = self.sensors
+        circumference = self.drivebase._wheelCircumference
 
-        while self.run:
+        # Integration state, published to pose after every step
+        state = zeros(3)
+        state[0], state[1], state[2] = self.pose[0], self.pose[1], self.pose[2]
 
-            lm_phi, rm_phi = self.drivebase.getRot()
+        seq = sensors.seq
+        past_lm_pos, past_rm_pos = self.drivebase.getRot()
+        past_stamp = sensors.stamp
+        heading = self.heading
+        if heading is not None:
+            # The robot may have turned while the thread was stopped, the gyro saw it
+            heading.reset(radians(self.drivebase.gyro.getProcessedAngle()))
 
-            Vl = lm_phi - past_lm_pos
-            Vr = rm_phi - past_rm_pos
+        self.rate.reset()
+        while self.run:
 
-            V = self.drivebase._wheelCircumference*(Vr + Vl)/2
-            theata = radians(self.drivebase.gyro.getProcessedAngle())
+            self.rate.wait()
 
-            Vx = V*cos(theata)
-            Vy = V*sin(theata)
+            if sensors.seq == seq:
+                continue
+            seq = sensors.seq
 
-            with self.lock:
-                self.x += Vx
-                self.y += Vy
-                self.theata = theata
+            lm_phi, rm_phi = self.drivebase.getRot()
+            stamp = sensors.stamp
+            if heading is None:
+                newTheata = radians(self.drivebase.gyro.getProcessedAngle())
+            else:
+                heading.sample()
+            if sensors.seq != seq:
+                # A new snapshot was published while reading, use it on the next tick
+                continue
+            if heading is not None:
+                newTheata = heading.update(lm_phi - past_lm_pos, rm_phi - past_rm_pos,
+                                           ticks_diff(stamp, past_stamp) / 1000000)
+
+            odometryStep(state, circumference*(lm_phi - past_lm_pos + rm_phi - past_rm_pos)/2, newTheata)
+            self.publish(state[0], state[1], state[2], stamp)
 
             past_lm_pos, past_rm_pos = lm_phi, rm_phi
+            past_stamp = stamp
+
+        self.running = False
 
     @micropython.native
     def stop(self) -> None:
         """
-        Stops the odometry thread.
+        Stops the odometry thread and waits for it to exit.
         """
         self.run = False
+        while self.running:
+            sleep(0.001)
+
+    @micropython.native
+    def publish(self, x: float, y: float, theata: float, stamp: int) -> None:
+        """
+        Publishes a pose and adds it to the history.
+        Parameters:
+            x: float
+            y: float
+            theata: float
+            stamp: int - Snapshot timestamp in microseconds
+        """
+        self.seq += 1
+        self.pose[0], self.pose[1], self.pose[2] = x, y, theata
+        self.seq += 1
+
+        head = self.head
+        self.times[head] = stamp
+        self.xs[head], self.ys[head], self.theatas[head] = x, y, theata
+        head += 1
+        if head == self.history:
+            head = 0
+        self.head = head
+        if self.samples < self.history:
+            self.samples += 1
 
     @micropython.native
     def getPos2d(self) -> [float, float, float]:
@@ -72,18 +154,80 @@ class DiffrentialDriveOdometry:
             y: float
             theata: float
         """
-        with self.lock:
-            return self.x, self.y, self.theata
+        while True:
+            seq = self.seq
+            if seq & 1:
+                continue
+            x, y, theata = self.pose[0], self.pose[1], self.pose[2]
+            if self.seq == seq:
+                return x, y, theata
+
+    @micropython.native
+    def readPose(self, out: object) -> None:
+        """
+        Copies the current position of the robot into an array.
+        Parameters:
+            out: array - (x, y, theata) are written to out[0..2]
+        """
+        pose = self.pose
+        while True:
+            seq = self.seq
+            if seq & 1:
+                continue
+            out[0], out[1], out[2] = pose[0], pose[1], pose[2]
+            if self.seq == seq:
+                return
+
+    @micropython.native
+    def getPosAt(self, stamp: int) -> [float, float, float]:
+        """
+        Returns the position of the robot at a recent time, interpolated from the history.
+        Times older than the history return the oldest pose.
+        Parameters:
+            stamp: int - Time in microseconds (ticks_us)
+        Returns:
+            x: float
+            y: float
+            theata: float
+        """
+        head, samples, history = self.head, self.samples, self.history
+
+        newer = head - 1 if head > 0 else history - 1
+        if samples == 0 or ticks_diff(stamp, self.times[newer]) >= 0:
+            return self.getPos2d()
+
+        for _ in range(samples - 1):
+            older = newer - 1 if newer > 0 else history - 1
+            if ticks_diff(stamp, self.times[older]) >= 0:
+                t = ticks_diff(stamp, self.times[older]) / ticks_diff(self.times[newer], self.times[older])
+                dTheata = self.theatas[newer] - self.theatas[older]
+                if dTheata > pi: dTheata -= 2*pi
+                elif dTheata < -pi: dTheata += 2*pi
+                return (self.xs[older] + (self.xs[newer] - self.xs[older])*t,
+                        self.ys[older] + (self.ys[newer] - self.ys[older])*t,
+                        self.theatas[older] + dTheata*t)
+            newer = older
+
+        return self.xs[newer], self.ys[newer], self.theatas[newer]
 
     @micropython.native
     def resetPos(self, x: float = 0, y: float = 0, theata: float = 0) -> None:
         """
         Resets the position of the robot.
+        Stops the odometry thread while resetting and restarts it if it was running.
         Parameters:
             x: float
             y: float
             theata: float
         """
+        running = self.running
+        self.stop()
+
         self.drivebase.gyro.reset(degrees(theata))
-        with self.lock:
-            self.x, self.y, self.theata = x, y, theata
+        if self.heading is not None:
+            self.heading.reset(theata)
+        self.head = self.samples = 0
+        self.publish(x, y, theata, self.sensors.stamp)
+
+        if running:
+            self.start()
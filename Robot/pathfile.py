@@ -0,0 +1,322 @@
+import micropython
+from _thread import allocate_lock
+from binascii import crc32
+from gc import collect
+from os import stat
+from struct import calcsize, pack, unpack
+from time import sleep
+from trajectory import Trajectory
+from mytools import thread, zeros
+
+try:
+    from gc import mem_free
+except ImportError:
+    # CPython
+    mem_free = None
+
+
+# Binary path file format (written by Tools/buildPath.py), little endian:
+#   Header: magic: 4s, version: H, fields: H, splines: H, config: H, checksum: I
+#   Index: count: I, checksum: I per spline - Number of waypoints and crc32 of the spline's data
+#   Data: per spline, fields columns of count float32 values:
+#       time, x, y, theata, V, omega, accL, accR,
+#       sin, cos (of theata), speedL, speedR (wheel speeds in motor degrees), dutyL, dutyR (FF duty cycles)
+#   config: configChecksum of the robot config the feedforward columns were built for
+#   checksum: crc32 of the index
+
+MAGIC = b'FLLP'
+VERSION = 4
+FIELDS = 14
+HEADER = '<4sHHHHI'
+HEADER_SIZE = calcsize(HEADER)
+
+
+class PathFileError(Exception):
+    def __init__(self, filename):
+        self.filename = filename
+
+
+def configChecksum(circumference: float, halfDBM: float, ffL: list, ffR: list) -> int:
+    """
+    Returns the checksum of the robot constants the feedforward columns depend on.
+    Parameters:
+        circumference: float - Wheel circumference
+        halfDBM: float - Half of the DBM
+        ffL: [float, float, float] - Left motor Ks, Kv, Ka
+        ffR: [float, float, float] - Right motor Ks, Kv, Ka
+    Returns:
+        checksum: int - 16 bits
+    """
+    return crc32(pack('<8f', circumference, halfDBM, *ffL, *ffR)) & 0xFFFF
+
+
+class PathFile:
+    """
+    PathFile class
+    Streams a binary path file spline by spline.
+    Only the splines that were requested are resident, the next spline can be prefetched in the background.
+    Every column is read straight into a float32 array, without parsing values.
+    Parameters:
+        filename: str
+    """
+
+    def __init__(self, filename: str):
+
+        self.filename = filename
+        self.lock = allocate_lock()
+
+        with open(filename, 'rb') as f:
+
+            magic, version, fields, splines, config, checksum = unpack(HEADER, f.read(HEADER_SIZE))
+            if magic != MAGIC or version != VERSION or fields != FIELDS:
+                raise PathFileError(filename)
+
+            self.index = zeros(splines*2, 'I')
+            f.readinto(self.index)
+
+        if crc32(self.index) != checksum:
+            raise PathFileError(filename)
+
+        self.offsets = zeros(splines, 'I')
+        offset = HEADER_SIZE + len(self.index)*4
+        for spline in range(splines):
+            self.offsets[spline] = offset
+            offset += self.index[spline*2] * FIELDS * 4
+
+        self.splines = [None] * splines
+        self.pinned = False
+        # Times each spline was released, a prefetch requested before a release is stale
+        self.releases = [0] * splines
+
+        self.config = config
+
+        # Bound stop events and markers, set by the runner
+        self.events = None
+
+    def __len__(self) -> int:
+        return len(self.splines)
+
+    @micropython.native
+    def get(self, spline: int) -> Trajectory:
+        """
+        Returns a spline, reads it if it is not resident.
+        Waits for a prefetch of the same spline to finish.
+        Parameters:
+            spline: int - Spline index
+        Returns:
+            trajectory: Trajectory
+        """
+        with self.lock:
+            if self.splines[spline] is None:
+                self.splines[spline] = self.read(spline)
+            return self.splines[spline]
+
+    @micropython.native
+    def prefetch(self, spline: int, pool: object = None) -> object:
+        """
+        Reads a spline in the background, unless it is resident.
+        Runs on a worker pool, so no thread is started while a path runs.
+        Parameters:
+            spline: int - Spline index
+            pool: WorkerPool - Runs the read, a new thread without it
+        Returns:
+            job: Job - Job handle, None if nothing was submitted to a pool
+        """
+        if self.pinned or self.splines[spline] is not None:
+            return None
+        if pool is None:
+            thread(self.fetch)(spline, self.releases[spline])
+            return None
+        return pool.submit(self.fetch, (spline, self.releases[spline]))
+
+    @micropython.native
+    def fetch(self, spline: int, releases: int) -> None:
+        """
+        Reads a spline if it is not resident and was not released since the prefetch.
+        A prefetch that runs after get read the spline and release dropped it would
+        otherwise read it back in for the rest of the run.
+        Yields between columns so the control loop keeps running.
+        Parameters:
+            spline: int - Spline index
+            releases: int - Releases of the spline when the prefetch was requested
+        """
+        with self.lock:
+            if self.splines[spline] is None and self.releases[spline] == releases:
+                self.splines[spline] = self.read(spline, True)
+
+    @micropython.native
+    def release(self, spline: int) -> None:
+        """
+        Drops a spline from memory, unless the path is pinned.
+        Parameters:
+            spline: int - Spline index
+        """
+        if not self.pinned:
+            with self.lock:
+                self.splines[spline] = None
+                self.releases[spline] += 1
+
+    @micropython.native
+    def releaseAll(self) -> None:
+        """
+        Unpins the path and drops all of its splines from memory.
+        """
+        self.pinned = False
+        for spline in range(len(self.splines)):
+            self.splines[spline] = None
+
+    @micropython.native
+    def nbytes(self) -> int:
+        """
+        Returns the memory used by the path when all of its splines are resident.
+        Returns:
+            nbytes: int
+        """
+        waypoints = 0
+        for spline in range(len(self.splines)):
+            waypoints += self.index[spline*2]
+        return waypoints * FIELDS * 4
+
+    @micropython.native
+    def read(self, spline: int, background: bool = False) -> Trajectory:
+        """
+        Reads a spline from the file and checks its checksum.
+        Parameters:
+            spline: int - Spline index
+            background: bool - Yield between columns
+        Returns:
+            trajectory: Trajectory
+        """
+        trajectory = Trajectory(self.index[spline*2])
+
+        crc = 0
+        with open(self.filename, 'rb') as f:
+            f.seek(self.offsets[spline])
+            for column in trajectory.columns:
+                f.readinto(column)
+                crc = crc32(column, crc)
+                if background:
+                    sleep(0)
+
+        if crc != self.index[spline*2+1]:
+            raise PathFileError(self.filename)
+
+        return trajectory
+
+
+class PathCache:
+    """
+    PathCache class
+    Keeps paths resident between runs, keyed by name and file modification time.
+    Paths are pinned (kept fully in memory) while they fit in the budget,
+    least recently used paths are evicted first.
+    Parameters:
+        budget: int - Max bytes of pinned paths
+        reserve: int - Min free heap bytes (gc.mem_free) to keep
+    """
+
+    def __init__(self, budget: int, reserve: int = 0):
+
+        self.budget = budget
+        self.reserve = reserve
+
+        self.paths = {}
+        self.order = []
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @micropython.native
+    def get(self, name: str, filename: str) -> PathFile:
+        """
+        Returns a cached path, opens it on a miss or when the file changed.
+        Parameters:
+            name: str - Path name
+            filename: str - Path file
+        Returns:
+            path: PathFile
+        """
+        mtime = stat(filename)[8]
+
+        if name in self.paths and self.paths[name][0] == mtime:
+            self.hits += 1
+            self.order.remove(name)
+            self.order.append(name)
+            return self.paths[name][1]
+
+        self.misses += 1
+        if name in self.paths:
+            self.evict(name)
+
+        path = PathFile(filename)
+        self.paths[name] = (mtime, path)
+        self.order.append(name)
+
+        self.fit(path)
+
+        return path
+
+    @micropython.native
+    def fit(self, path: PathFile) -> None:
+        """
+        Evicts least recently used paths until the new path fits, then pins it.
+        A path that can not fit alone is streamed instead.
+        Parameters:
+            path: PathFile - Newest path
+        """
+        if path.nbytes() > self.budget:
+            return
+
+        while self.order[0] != self.order[-1] and (self.nbytes() + path.nbytes() > self.budget or not self.free()):
+            self.evict(self.order[0])
+
+        path.pinned = self.free()
+
+    @micropython.native
+    def free(self) -> bool:
+        """
+        Returns if the heap has more free memory than the reserve.
+        Returns:
+            free: bool
+        """
+        if mem_free is None:
+            return True
+        collect()
+        return mem_free() >= self.reserve
+
+    @micropython.native
+    def evict(self, name: str) -> None:
+        """
+        Drops a path from the cache.
+        Parameters:
+            name: str - Path name
+        """
+        self.paths.pop(name)[1].releaseAll()
+        self.order.remove(name)
+        self.evictions += 1
+        collect()
+
+    @micropython.native
+    def clear(self) -> None:
+        """
+        Drops all paths from the cache.
+        """
+        while self.order:
+            self.evict(self.order[0])
+
+    @micropython.native
+    def nbytes(self) -> int:
+        """
+        Returns the memory used by the pinned paths.
+        Returns:
+            nbytes: int
+        """
+        nbytes = 0
+        for _, path in self.paths.values():
+            if path.pinned:
+                nbytes += path.nbytes()
+        return nbytes
+
+    def __repr__(self):
+        return "hits: {} misses: {} evictions: {} bytes: {}".format(self.hits, self.misses, self.evictions, self.nbytes())
@@ -0,0 +1,88 @@
+import micropython
+from mytools import zeros
+
+
+class Profiler:
+    """
+    Profiler class
+    Fixed bucket latency histograms for the phases of the control loop.
+    Recording a latency only increments counters, nothing is allocated.
+    Parameters:
+        phases: tuple - Phase names
+        width: int - Bucket width in microseconds
+        buckets: int - Number of buckets, the last bucket also counts everything above it
+    """
+
+    def __init__(self, phases: tuple, width: int = 50, buckets: int = 200):
+
+        self.phases = phases
+        self.width = width
+        self.buckets = buckets
+
+        self.counts = zeros(len(phases)*buckets, 'I')
+        self.totals = zeros(len(phases), 'I')
+        self.max = zeros(len(phases), 'I')
+
+    @micropython.native
+    def reset(self) -> None:
+        """
+        Clears all histograms.
+        """
+        for i in range(len(self.counts)):
+            self.counts[i] = 0
+        for i in range(len(self.phases)):
+            self.totals[i] = 0
+            self.max[i] = 0
+
+    @micropython.native
+    def add(self, phase: int, us: int) -> None:
+        """
+        Records a latency.
+        Parameters:
+            phase: int - Phase index
+            us: int - Latency in microseconds
+        """
+        bucket = us // self.width
+        if bucket >= self.buckets:
+            bucket = self.buckets - 1
+        self.counts[phase*self.buckets + bucket] += 1
+        self.totals[phase] += 1
+        if us > self.max[phase]:
+            self.max[phase] = us
+
+    @micropython.native
+    def merge(self, other: object) -> None:
+        """
+        Adds the histograms of another profiler with the same phases and buckets.
+        Parameters:
+            other: Profiler
+        """
+        for i in range(len(self.counts)):
+            self.counts[i] += other.counts[i]
+        for i in range(len(self.phases)):
+            self.totals[i] += other.totals[i]
+            if other.max[i] > self.max[i]:
+                self.max[i] = other.max[i]
+
+    @micropython.native
+    def percentile(self, phase: int, p: float) -> int:
+        """
+        Returns a latency percentile, rounded up to the bucket's upper edge.
+        Parameters:
+            phase: int - Phase index
+            p: float - Percentile [0, 100]
+        Returns:
+            us: int - Latency in microseconds
+        """
+        target = self.totals[phase] * p / 100
+        count = 0
+        for bucket in range(self.buckets):
+            count += self.counts[phase*self.buckets + bucket]
+            if count >= target and count > 0:
+                return (bucket + 1) * self.width
+        return 0
+
+    def __repr__(self):
+        return "\n".join("{}: n: {} p50: {}us p99: {}us max: {}us".format(
+            name, self.totals[phase], self.percentile(phase, 50), self.percentile(phase, 99), self.max[phase])
+            for phase, name in enumerate(self.phases))
@@ -0,0 +1,18 @@
+# Commands that can be used in path events (stop events and markers).
+# The index of a command is its ID in the .events files, so only append new commands.
+# Names are resolved from the runner, e.g. 'runner.rm.RunTime' is Runner.rm.RunTime.
+COMMANDS = (
+    'runner.lm.RunTime',
+    'runner.rm.RunTime',
+    'runner.lm.runImmediate',
+    'runner.rm.runImmediate',
+    'runner.lm.Turn',
+    'runner.rm.Turn',
+    'runner.lm.TurnABS',
+    'runner.rm.TurnABS',
+    'runner.drivebase.stop',
+    'runner.run1',
+    'runner.run2_M3',
+    'runner.run2_M11',
+    'runner.run4_M7',
+)
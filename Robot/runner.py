@@ -1,14 +1,32 @@
 import micropython
+from json import load as loadJSON
 from gc import collect
-from _thread import allocate_lock, start_new_thread
-from mytools import thread, Timer
+from mytools import Timer, Rate, zeros, ticks_us, ticks_diff
 from time import time, sleep
 from math import pi
 from controllers import RAMSETEController
 from odometry import DiffrentialDriveOdometry
 from drivebase import DriveBase
+from actuators import ActuatorLoop
 from ev3devices_advanced import Motor
 from sensorbase import Sensorbase
+from sensors import SensorService
+from pathfile import PathFile, PathCache, configChecksum
+from registry import COMMANDS
+from trajectory import Trajectory, TrajectorySampler
+from profiler import Profiler
+from logger import RunLog
+from workers import WorkerPool
+from scheduler import MarkerScheduler
+from kernels import cmToDeg, ACCL, ACCR, SPEEDL, SPEEDR, DUTYL, DUTYR
+
+
+# Control loop phases
+PHASES = ('waypoint', 'odometry', 'ramsete', 'write', 'log', 'tick')
+WAYPOINT, ODOMETRY, RAMSETE, WRITE, LOG, TICK = range(len(PHASES))
+
+# Path and events files directory
+PATHS = "/home/robot/Robot/Paths/"
 
 
 class Runner:
@@ -19,23 +37,50 @@ class Runner:
         config: dict
     """
 
-    lock = allocate_lock()
-
     runID = None
     lastRunID = None
 
-    __preloadPathName = None
-    __preloadPath = None
-
     def __init__(self, config: dict):
 
-        self.drivebase = DriveBase(config)
-        self.odometry = DiffrentialDriveOdometry(self.drivebase, self.lock)
+        self.actuators = ActuatorLoop(config.runner.actuators.period)
+        self.drivebase = DriveBase(config, self.actuators)
 
         self.sensorbase = Sensorbase(config.sensorbase, config.light, self.drivebase)
 
-        self.lm = Motor(config.motors.left)
-        self.rm = Motor(config.motors.right)
+        self.pool = WorkerPool(config.runner.workers.threads, config.runner.workers.queue)
+
+        self.lm = Motor(config.motors.left, pool=self.pool)
+        self.rm = Motor(config.motors.right, pool=self.pool)
+        self.actuators.coalesce(self.lm)
+        self.actuators.coalesce(self.rm)
+
+        self.sensors = SensorService(config.runner.sensors.period, config.runner.sensors.estimator)
+        for device in (self.drivebase.lm, self.drivebase.rm, self.drivebase.gyro,
+                       self.lm, self.rm, self.sensorbase.ll, self.sensorbase.rl):
+            self.sensors.register(device)
+        self.sensors.start()
+
+        self.odometry = DiffrentialDriveOdometry(self.drivebase, self.sensors, config.odometry)
+
+        self.sampler = TrajectorySampler()
+        # Control loop buffers: current pose, wheels (Vl, Vr) in cm and (Vl, Vr, accL, accR) in degrees
+        self.pose = zeros(3)
+        self.wheels = zeros(6)
+
+        self.paths = PathCache(config.runner.cache.budget, config.runner.cache.reserve)
+        # Paths built for this config can use their feedforward columns
+        self.pathConfig = configChecksum(config.wheel.circumference, config.drivebase.halfDBM,
+                                         config.drivebase.motor.left.ff, config.drivebase.motor.right.ff)
+
+        self.rate = Rate(config.runner.period)
+
+        self.profiler = Profiler(PHASES)
+        self.pathProfiler = Profiler(PHASES)
+        self.latency = ""
+
+        self.log = RunLog(config.runner.log.capacity)
+
+        self.scheduler = MarkerScheduler(self)
 
     @micropython.native
     def path(self, filename: str, b: float, zeta: float, _log: bool = False) -> [list, int]:
@@ -49,44 +94,55 @@ class Runner:
             zeta: float - Zeta
             _log: bool - Log
         Returns:
-            logs: list - Logs
+            log: RunLog - Run log, None if not logged
             counter: int - Counter
         """
         collect()
 
         self.runID = (self.lastRunID or 0) + 1; self.lastRunID = self.runID
+        self.pool.runID = self.runID
 
-        if self.__preloadPathName == filename:
-            path = self.__preloadPath
-        else:
-            path = self.load(filename)
-        self.__preloadPathName = None
-        self.__preloadPath = None
+        path = self.load(filename)
+        stopEvents, markers = path.events
 
-        with open("/home/robot/Robot/Paths/"+filename+".events", "r") as f:
-            stopEvents, markers = eval(f.readline())
+        if _log:
+            self.log.reset()
 
-        logs = []
         counter = 0
 
-        self.RAMSETE = RAMSETEController(b, zeta, self.drivebase._halfDBM)
+        self.RAMSETE = RAMSETEController(b, zeta, self.drivebase._halfDBM, self.drivebase._wheelCircumference)
 
-        self.odometry.resetPos(path[0][0][1], path[0][0][2], path[0][0][3])
+        fast = path.config == self.pathConfig
+        if not fast:
+            print("Path was built for another config, not using its feedforward")
+
+        self.odometry.resetPos(*path.get(0).getStart())
         self.odometry.start()
 
         self.stopEventsHandler(stopEvents[0], self.runID)
 
         self.timer = Timer()
+        self.scheduler.start(markers, self.timer, self.runID)
+
+        self.pathProfiler.reset()
+        latency = []
 
-        for index, spline in enumerate(path):
+        for index in range(len(path)):
 
-            self.markersHandler(markers[index], self.runID)
+            spline = path.get(index)
+            if index+1 < len(path):
+                path.prefetch(index+1, self.pool)
 
-            log, count = self.spline(spline, self.runID, _log)
+            count = self.spline(spline, index, self.runID, _log, fast)
             self.timer.pause()
 
+            spline = None
+            path.release(index)
+
             counter += count
-            logs.append(log)
+
+            self.pathProfiler.merge(self.profiler)
+            latency.append("Spline {}:\n{}".format(index, self.profiler))
 
             if self.runID != self.lastRunID:
                 print("Stopped path")
@@ -99,57 +155,94 @@ class Runner:
         self.odometry.stop()
 
         self.runID = None
+        self.pool.runID = None
+
+        latency.append("Path:\n{}".format(self.pathProfiler))
+        latency.append("Markers: {}".format(self.scheduler))
+        latency.append("Actuators: {}".format(self.actuators))
+        self.latency = "\n".join(latency)
 
         print("Finished path")
+        if _log and self.log.dropped:
+            print("Run log wrapped, dropped {} samples, raise runner.log.capacity".format(self.log.dropped))
 
-        return logs, counter
+        return self.log if _log else None, counter
 
     @micropython.native
-    def spline(self, path: list, runID: int, _log: bool = False) -> [list, int]:
+    def spline(self, path: Trajectory, index: int, runID: int, _log: bool = False, fast: bool = False) -> int:
         """
         Traverse a spline.
         Parameters:
-            waypointsFile: object - Waypoints file
-            RAMSETE: RAMSETEController - RAMSETE controller
+            path: Trajectory - Spline
+            index: int - Spline index
+            runID: int - Run ID
             _log: bool - Log
+            fast: bool - Use the spline's precomputed feedforward
         Returns:
-            log: list - Log
             count: int - Counter
-            waypoint: dict - Waypoint
         """
         collect()
         count = 0
 
-        if _log:
-            log = []
-        else:
-            log = None
+        log = self.log
 
-        index = 0
+        sampler = self.sampler
+        sampler.reset(path)
+        target = sampler.state
 
-        while self.runID == runID:
+        odometry, drivebase, controller = self.odometry, self.drivebase, self.RAMSETE
+        pose, wheels = self.pose, self.wheels
+        circumference = drivebase._wheelCircumference
 
-            cTime = self.timer.get()
+        rate = self.rate
+        rate.reset()
 
-            waypoint, index = self.getTargetWaypoint(cTime, path, index)
-            if waypoint is None:
-                break
+        profiler = self.profiler
+        profiler.reset()
 
-            currentX, currentY, currentTheata = self.odometry.getPos2d()
-            Vx, Vy = waypoint[1] - currentX, waypoint[2] - currentY
+        while self.runID == runID:
 
-            Vl, Vr = self.RAMSETE.correction(Vx, Vy, currentTheata,
-                                             waypoint[4], waypoint[5], waypoint[3])
+            st = ticks_us()
+            cTime = self.timer.get()
 
-            self.drivebase.run_tankCM(Vl, Vr, waypoint[6], waypoint[7])
+            if not sampler.sample(cTime):
+                break
+            t1 = ticks_us(); profiler.add(WAYPOINT, ticks_diff(t1, st))
+
+            odometry.readPose(pose)
+            t2 = ticks_us(); profiler.add(ODOMETRY, ticks_diff(t2, t1))
+
+            if fast:
+                controller.feedforwardInto(pose, target, wheels)
+            else:
+                controller.correctionInto(pose, target, wheels)
+                wheels[2], wheels[3] = wheels[0], wheels[1]
+                wheels[4], wheels[5] = target[ACCL], target[ACCR]
+                cmToDeg(wheels, 2, 4, circumference)
+            t1 = ticks_us(); profiler.add(RAMSETE, ticks_diff(t1, t2))
+
+            if fast:
+                drivebase.run_tankFF(wheels[2], wheels[3], target[SPEEDL], target[SPEEDR],
+                                     target[DUTYL], target[DUTYR])
+            else:
+                drivebase.run_tank(wheels[2], wheels[3], wheels[4], wheels[5])
+            t2 = ticks_us(); profiler.add(WRITE, ticks_diff(t2, t1))
 
             if _log:
-                log.append((cTime, currentX, currentY, currentTheata, self.drivebase.getSpeed(), Vl, Vr))
+                log.add(cTime, index, pose[0], pose[1], pose[2],
+                        drivebase.lm.getSpeed(), drivebase.rm.getSpeed(), wheels[0], wheels[1])
+            t1 = ticks_us(); profiler.add(LOG, ticks_diff(t1, t2))
+
+            profiler.add(TICK, ticks_diff(t1, st))
 
             count += 1
 
+            rate.wait()
+
         self.drivebase.stop()
-        return log, count
+        sampler.reset(None)
+        print("Control loop:", rate)
+        return count
 
     @micropython.native
     def stopEventsHandler(self, stopEvent: dict, runID: int) -> None:
@@ -173,23 +266,6 @@ class Runner:
             if dt > 0:
                 sleep(dt)
 
-    @micropython.native
-    @thread
-    def markersHandler(self, markers: list, runID: int) -> None:
-        """
-        Handle markers.
-        Parameters:
-            markers: tuple - Markers
-            cTime: float - Current time
-        """
-        if len(markers) > 0:
-            dt = markers[0][0]-self.timer.get()
-            if dt > 0:
-                sleep(dt)
-            self.commands(markers[0][1], "parallel", runID)
-            if self.runID == runID:
-                self.markersHandler(markers[1:], runID)
-
     @micropython.native
     def commands(self, commands: list, execBehavior: str, runID: int) -> None:
         """
@@ -199,61 +275,90 @@ class Runner:
             execBehavior: str - Execution behavior
         """
         if execBehavior == "parallel":
-            for command in commands:
+            for method, args, kwargs in commands:
                 if self.runID == runID:
-                    start_new_thread(eval, (command,))
+                    self.pool.submit(method, args, kwargs, runID)
         elif execBehavior == "sequential":
-            for command in commands:
+            for method, args, kwargs in commands:
                 if self.runID == runID:
-                    eval(command)
+                    method(*args, **kwargs)
 
     @micropython.native
-    def getTargetWaypoint(self, cTime: float, path: list, index: int) -> [list, int]:
+    def loadEvents(self, filename: str) -> [list, list]:
         """
-        Get target waypoint.
+        Load the events of a path and bind their commands.
         Parameters:
-            cTime: float - Current time
-            path: list - Path
-            index: int - Index
+            filename: str - Path name
         Returns:
-            waypoint: list - Waypoint
-            index: int - Index
+            stopEvents: list - Stop events
+            markers: list - (time, commands) markers of all splines, sorted by time
         """
-        for waypoint in path[index:]:
-            if waypoint[0] > cTime:
-                return waypoint, index
-            index += 1
+        with open(PATHS+filename+".events", "r") as f:
+            events = loadJSON(f)
 
-        else:
-            return None, index
+        stopEvents = events["stopEvents"]
+        for stopEvent in stopEvents:
+            stopEvent["commands"] = self.bind(stopEvent["commands"])
+
+        markers = sorted([(mTime, self.bind(commands)) for spline in events["markers"] for mTime, commands in spline],
+                         key=lambda marker: marker[0])
+
+        return stopEvents, markers
+
+    def bind(self, commands: list) -> list:
+        """
+        Resolve command IDs to bound methods.
+        Parameters:
+            commands: list - [ID, args, kwargs] commands
+        Returns:
+            commands: list - (method, args, kwargs) commands
+        """
+        bound = []
+        for ID, args, kwargs in commands:
+            method = self
+            for name in COMMANDS[ID].split('.')[1:]:
+                method = getattr(method, name)
+            bound.append((method, tuple(args), kwargs))
+        return bound
 
     @micropython.native
-    def load(self, filename: str):
+    def load(self, filename: str) -> PathFile:
+        """
+        Get a path from the path cache and read its first spline.
+        The rest of the splines are streamed while the path runs, unless the path is pinned in the cache.
+        Parameters:
+            filename: str - Path name
+        Returns:
+            path: PathFile - Path
+        """
         print("Loading Path...")
         st = time()
-        with open("/home/robot/Robot/Paths/"+filename+".path", "r") as f:
-            path = eval(f.read())
+        path = self.paths.get(filename, PATHS+filename+".path")
+        path.get(0)
+        if path.events is None:
+            path.events = self.loadEvents(filename)
         print("Loaded path in", time()-st)
+        print("Path cache:", self.paths)
         return path
 
     @micropython.native
     def preload(self, filename: str):
         collect()
-        self.__preloadPath = self.load(filename)
-        self.__preloadPathName = filename
+        self.load(filename)
 
     @micropython.native
     def unload(self):
-        self.__preloadPath = None
-        self.__preloadPathName = None
+        self.paths.clear()
         collect()
 
     @micropython.native
     def exit(self):
+        self.pool.cancel(self.runID)
         self.runID = None
+        self.pool.runID = None
         self.drivebase.stopUpdate()
-        self.lm.stopUpdate()
-        self.rm.stopUpdate()
+        self.actuators.unregister(self.lm)
+        self.actuators.unregister(self.rm)
         self.odometry.stop()
 
     @micropython.native
@@ -285,7 +390,6 @@ class Runner:
     @micropython.native
     def run4_M7(self):
 
-        @thread
         def base():
             sleep(2)
             self.rm.RunTime(1000, 1)
@@ -298,4 +402,4 @@ class Runner:
         self.odometry.start()
         self.rm.RunTime(-200, 2)
         self.lm.RunTime(-600, 1.5)
-        base()
+        self.pool.submit(base, runID=self.runID)
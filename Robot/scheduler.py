@@ -0,0 +1,76 @@
+import micropython
+from time import sleep
+from mytools import thread, zeros
+
+
+class MarkerScheduler:
+    """
+    MarkerScheduler class
+    Runs all the markers of a path from a single thread.
+    Markers are sorted by time, the thread sleeps until the next deadline
+    and hands the marker's commands to the runner's worker pool.
+    The timing error of every marker is recorded.
+    Parameters:
+        runner: Runner
+    """
+
+    def __init__(self, runner: object):
+
+        self.runner = runner
+
+        self.markers = ()
+        self.errors = zeros(0)
+        self.fired = 0
+
+    @micropython.native
+    def start(self, markers: list, timer: object, runID: int) -> None:
+        """
+        Starts the scheduler thread for a run.
+        Parameters:
+            markers: list - (time, commands) markers sorted by time
+            timer: Timer - Path timer
+            runID: int - Run ID
+        """
+        self.markers = markers
+        self.errors = zeros(len(markers))
+        self.fired = 0
+        self.loop(markers, timer, runID)
+
+    @micropython.native
+    @thread
+    def loop(self, markers: list, timer: object, runID: int) -> None:
+        """
+        Waits for every marker and dispatches it.
+        Stops when the run changes.
+        Runs as thread.
+        Parameters:
+            markers: list - (time, commands) markers sorted by time
+            timer: Timer - Path timer
+            runID: int - Run ID
+        """
+        runner = self.runner
+
+        for index in range(len(markers)):
+
+            mTime, commands = markers[index]
+
+            while runner.runID == runID:
+                dt = mTime - timer.get()
+                if dt <= 0:
+                    break
+                # Wake up at least every 0.1s to notice a stopped run
+                sleep(dt if dt < 0.1 else 0.1)
+
+            if runner.runID != runID:
+                return
+
+            self.errors[index] = timer.get() - mTime
+            runner.commands(commands, "parallel", runID)
+            self.fired += 1
+
+    def __repr__(self):
+        errors = self.errors[:self.fired]
+        if not errors:
+            return "fired: 0/{}".format(len(self.markers))
+        return "fired: {}/{} error mean: {:.1f}ms max: {:.1f}ms".format(
+            self.fired, len(self.markers), sum(errors) / len(errors) * 1000, max(errors) * 1000)
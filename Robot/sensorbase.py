@@ -43,6 +43,9 @@ class Sensorbase:
         startAngle = mean(*self.drivebase.getAngle())
         st = time()
 
+        # Paced by the sensor snapshots, the loop only reads them
+        seq = self.drivebase.lm.waitSample()
+
         while (abs(mean(*self.drivebase.getAngle()) - startAngle)/360 * self.drivebase._wheelCircumference < abs(dist) and
                time() - st < timeout):
 
@@ -53,6 +56,7 @@ class Sensorbase:
             correction = PID.correction(None, error)
 
             self.drivebase.run_tank(speed-correction, speed+correction)
+            seq = self.drivebase.lm.waitSample(seq)
 
         self.drivebase.stop()
 
@@ -73,6 +77,7 @@ class Sensorbase:
 
         st = time()
 
+        seq = self.drivebase.lm.waitSample()
         error = target - self.drivebase.gyro.getProcessedAngle()
         if error < -180:
             error += 360
@@ -90,10 +95,12 @@ class Sensorbase:
                 correction = PID.correction(None, error)
 
                 self.drivebase.run_tank(-correction, correction)
+                seq = self.drivebase.lm.waitSample(seq)
 
             self.drivebase.stop()
             sleep(0.1)
 
+            seq = self.drivebase.lm.waitSample(seq)
             error = target - self.drivebase.gyro.getProcessedAngle()
             if error < -180:
                 error += 360
@@ -120,6 +127,7 @@ class Sensorbase:
         startAngle = mean(self.drivebase.getAngle())
 
         st = time()
+        seq = self.drivebase.lm.waitSample()
 
         while (mean(self.drivebase.getAngle()) - startAngle <
                dist / self.drivebase._wheelCircumference and
@@ -127,6 +135,7 @@ class Sensorbase:
 
             corr = PID.correction(cl.getReflectedLight())
             self.drivebase.run_tank(speed + corr, speed - corr)
+            seq = self.drivebase.lm.waitSample(seq)
 
     @micropython.native
     def Box(self, rfl: int, speed: int, Kp: float = None, Ki: float = None, Kd: float = None, timeout: float = 60,
@@ -142,6 +151,7 @@ class Sensorbase:
 
         st = time()
 
+        seq = self.drivebase.lm.waitSample()
         lRFL, rRFL = self.ll.getReflect(), self.rl.getReflect()
 
         while not between(lRFL, rfl, range) and not between(rRFL, rfl, range) and time() - st < timeout:
@@ -150,6 +160,7 @@ class Sensorbase:
 
                 self.drivebase.run_tank(speed, speed)
 
+                seq = self.drivebase.lm.waitSample(seq)
                 lRFL, rRFL = self.ll.getReflect(), self.rl.getReflect()
 
             sleep(0.1)
@@ -163,6 +174,7 @@ class Sensorbase:
                 while not between(rRFL, rfl, range) and time() - st < timeout:
 
                     self.drivebase.run_tank(0, speed)
+                    seq = self.drivebase.lm.waitSample(seq)
                     lRFL, rRFL = self.ll.getReflect(), self.rl.getReflect()
 
                 sleep(0.1)
@@ -177,6 +189,7 @@ class Sensorbase:
                 while not between(lRFL, rfl, range) and time() - st < timeout:
 
                     self.drivebase.run_tank(speed, 0)
+                    seq = self.drivebase.lm.waitSample(seq)
                     lRFL, rRFL = self.ll.getReflect(), self.rl.getReflect()
 
                 sleep(0.1)
@@ -0,0 +1,117 @@
+import micropython
+from mytools import thread, zeros, Rate, ticks_us, sleep_us
+
+
+class SensorService:
+    """
+    SensorService class
+    Reads every registered sensor once per cycle and publishes the values as a snapshot.
+    Snapshots are double buffered: a cycle is written to the back buffer, then published
+    by swapping buffers and incrementing the sequence number.
+    Devices read their values from the published snapshot.
+    Parameters:
+        period: float - Sampling period in seconds
+        estimator: object - Motor velocity estimator gains (alpha, beta, gamma, kappa), None to disable
+    """
+
+    def __init__(self, period: float, estimator: object = None):
+
+        self.rate = Rate(period)
+        self.estimator = estimator
+
+        self.devices = []
+        self.size = 0
+
+        self.buffers = (zeros(0), zeros(0))
+        self.buffer = self.buffers[0]
+        self.stamps = [0, 0]
+        self.stamp = 0
+        self.seq = 0
+
+        self.run = False
+
+    def register(self, device: object) -> None:
+        """
+        Registers a device, must be called before the service starts.
+        Parameters:
+            device: object - Motor, Gyro, DualGyro or LightSensor
+        """
+        device.attach(self)
+        self.sample()
+
+    def allocate(self, device: object, channels: int) -> int:
+        """
+        Allocates snapshot slots for a device.
+        Parameters:
+            device: object
+            channels: int - Number of values the device samples
+        Returns:
+            slot: int - First slot of the device
+        """
+        slot = self.size
+        self.size += channels
+        self.devices.append(device)
+
+        self.buffers = (zeros(self.size), zeros(self.size))
+        self.buffer = self.buffers[0]
+
+        return slot
+
+    @micropython.native
+    @thread
+    def start(self) -> None:
+        """
+        Starts the sampling thread.
+        """
+        self.run = True
+        self.rate.reset()
+        while self.run:
+            self.sample()
+            self.rate.wait()
+
+    @micropython.native
+    def stop(self) -> None:
+        """
+        Stops the sampling thread.
+        """
+        self.run = False
+
+    @micropython.native
+    def sample(self) -> None:
+        """
+        Reads all devices into the back buffer and publishes it.
+        """
+        seq = self.seq + 1
+        buffer = self.buffers[seq & 1]
+
+        for device in self.devices:
+            device.sample(buffer)
+        self.stamps[seq & 1] = ticks_us()
+
+        self.buffer = buffer
+        self.stamp = self.stamps[seq & 1]
+        self.seq = seq
+
+    @micropython.native
+    def value(self, slot: int) -> float:
+        """
+        Returns a value from the published snapshot.
+        Parameters:
+            slot: int
+        Returns:
+            value: float
+        """
+        return self.buffer[slot]
+
+    @micropython.native
+    def wait(self, seq: int) -> int:
+        """
+        Waits for a snapshot newer than seq.
+        Parameters:
+            seq: int - Last seen sequence number
+        Returns:
+            seq: int - Newest sequence number
+        """
+        while self.seq == seq:
+            sleep_us(200)
+        return self.seq
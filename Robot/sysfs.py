@@ -0,0 +1,109 @@
+import micropython
+
+# Duty cycle values -100..100 as newline terminated bytes, indexed by duty + 100
+DUTY = tuple((str(duty) + '\n').encode() for duty in range(-100, 101))
+
+
+@micropython.native
+def parseInt(buffer: bytearray, size: int, default: int) -> int:
+    """
+    Parses a decimal integer at the start of a buffer without allocating.
+    Parameters:
+        buffer: bytearray
+        size: int - Number of valid bytes in the buffer
+        default: int - Returned if the buffer holds no integer
+    Returns:
+        value: int
+    """
+    value = 0
+    negative = False
+    digits = False
+    for i in range(size):
+        c = buffer[i]
+        if 48 <= c <= 57:
+            value = value*10 + c - 48
+            digits = True
+        elif c == 45 and i == 0:
+            negative = True
+        else:
+            break
+    if not digits:
+        return default
+    return -value if negative else value
+
+
+@micropython.native
+def dutyBytes(dutyCycle: float) -> bytes:
+    """
+    Returns the bytes of a duty cycle, limited to [-100, 100].
+    Infinities are limited too, NaN stops the motor.
+    Parameters:
+        dutyCycle: float
+    Returns:
+        data: bytes
+    """
+    if dutyCycle > 100:
+        return DUTY[200]
+    if dutyCycle < -100:
+        return DUTY[0]
+    if dutyCycle != dutyCycle:
+        return DUTY[100]
+    return DUTY[int(dutyCycle) + 100]
+
+
+class SysfsReader:
+    """
+    SysfsReader class
+    Reads an integer sysfs attribute into a preallocated buffer.
+    The file is unbuffered, so a read is a seek and a single read syscall.
+    Parameters:
+        path: str
+        size: int - Buffer size
+    """
+
+    def __init__(self, path: str, size: int = 16):
+
+        self.file = open(path, 'rb', 0)
+        self.buffer = bytearray(size)
+        self.last = 0
+
+    @micropython.native
+    def read(self) -> int:
+        """
+        Reads the attribute.
+        Returns the last valid value if the attribute holds no integer.
+        Returns:
+            value: int
+        """
+        self.file.seek(0)
+        self.last = parseInt(self.buffer, self.file.readinto(self.buffer), self.last)
+        return self.last
+
+    def close(self) -> None:
+        self.file.close()
+
+
+class SysfsWriter:
+    """
+    SysfsWriter class
+    Writes a sysfs attribute with a single write syscall.
+    Parameters:
+        path: str
+    """
+
+    def __init__(self, path: str):
+
+        self.file = open(path, 'wb', 0)
+
+    @micropython.native
+    def write(self, data: bytes) -> None:
+        """
+        Writes the attribute.
+        Parameters:
+            data: bytes
+        """
+        self.file.seek(0)
+        self.file.write(data)
+
+    def close(self) -> None:
+        self.file.close()
@@ -0,0 +1,165 @@
+import micropython
+from math import pi
+from mytools import zeros
+from kernels import X, Y, THEATA, V, OMEGA, ACCL, ACCR, SIN, COS, SPEEDL, SPEEDR, DUTYL, DUTYR
+
+
+class Trajectory:
+    """
+    Trajectory class
+    Holds a spline as separate contiguous float32 columns (struct of arrays).
+    Columns can be indexed directly by the control loop: trajectory.x[index].
+    Parameters:
+        size: int - Number of waypoints
+    """
+
+    def __init__(self, size: int):
+
+        self.size = size
+
+        self.time = zeros(size)
+        self.x = zeros(size)
+        self.y = zeros(size)
+        self.theata = zeros(size)
+        self.V = zeros(size)
+        self.omega = zeros(size)
+        self.accL = zeros(size)
+        self.accR = zeros(size)
+
+        # Precomputed by Tools/buildPath.py
+        self.sin = zeros(size)
+        self.cos = zeros(size)
+        self.speedL = zeros(size)
+        self.speedR = zeros(size)
+        self.dutyL = zeros(size)
+        self.dutyR = zeros(size)
+
+        # Same order as the columns in the path file
+        self.columns = (self.time, self.x, self.y, self.theata, self.V, self.omega, self.accL, self.accR,
+                        self.sin, self.cos, self.speedL, self.speedR, self.dutyL, self.dutyR)
+
+    def __len__(self) -> int:
+        return self.size
+
+    @micropython.native
+    def getStart(self) -> [float, float, float]:
+        """
+        Returns the starting pose of the trajectory.
+        Returns:
+            x: float
+            y: float
+            theata: float
+        """
+        return self.x[0], self.y[0], self.theata[0]
+
+    @micropython.native
+    def getDuration(self) -> float:
+        """
+        Returns the time of the last waypoint.
+        Returns:
+            duration: float
+        """
+        return self.time[self.size-1]
+
+    @micropython.native
+    def nbytes(self) -> int:
+        """
+        Returns the memory used by the columns.
+        Returns:
+            nbytes: int
+        """
+        return self.size * len(self.columns) * 4
+
+
+class TrajectorySampler:
+    """
+    TrajectorySampler class
+    Samples a trajectory at an exact time, interpolating linearly between the two bracketing waypoints.
+    Keeps a cursor, so sampling increasing times is amortized O(1).
+    Results are stored in the state array (x, y, theata, V, omega, accL, accR,
+    sin, cos, speedL, speedR, dutyL, dutyR), indexed by the kernels layout constants.
+    Parameters:
+        trajectory: Trajectory
+    """
+
+    def __init__(self, trajectory: Trajectory = None):
+
+        self.state = zeros(13)
+
+        self.reset(trajectory)
+
+    @micropython.native
+    def reset(self, trajectory: Trajectory) -> None:
+        """
+        Sets the trajectory to sample and moves the cursor to its start.
+        Parameters:
+            trajectory: Trajectory
+        """
+        self.trajectory = trajectory
+        self.cursor = 0
+
+    @micropython.native
+    def sample(self, cTime: float) -> bool:
+        """
+        Samples the trajectory at a given time.
+        Parameters:
+            cTime: float - Time since the start of the trajectory
+        Returns:
+            running: bool - False if the trajectory ended
+        """
+        trajectory = self.trajectory
+        times = trajectory.time
+        last = trajectory.size - 1
+
+        if cTime > times[last]:
+            return False
+
+        cursor = self.cursor
+        if cTime < times[cursor]:
+            cursor = 0
+        while cursor < last and times[cursor+1] <= cTime:
+            cursor += 1
+        self.cursor = cursor
+
+        if cursor == last or cTime < times[cursor]:
+            self.set(cursor, cursor, 0.0)
+            return True
+
+        dt = times[cursor+1] - times[cursor]
+        if dt > 0:
+            self.set(cursor, cursor+1, (cTime - times[cursor]) / dt)
+        else:
+            self.set(cursor, cursor+1, 1.0)
+
+        return True
+
+    @micropython.native
+    def set(self, i: int, j: int, t: float) -> None:
+        """
+        Interpolates between two waypoints.
+        Parameters:
+            i: int - First waypoint
+            j: int - Second waypoint
+            t: float - Fraction [0, 1]
+        """
+        trajectory, state = self.trajectory, self.state
+
+        state[X] = trajectory.x[i] + (trajectory.x[j] - trajectory.x[i]) * t
+        state[Y] = trajectory.y[i] + (trajectory.y[j] - trajectory.y[i]) * t
+
+        dTheata = trajectory.theata[j] - trajectory.theata[i]
+        if dTheata > pi: dTheata -= 2*pi
+        elif dTheata < -pi: dTheata += 2*pi
+        state[THEATA] = trajectory.theata[i] + dTheata * t
+
+        state[V] = trajectory.V[i] + (trajectory.V[j] - trajectory.V[i]) * t
+        state[OMEGA] = trajectory.omega[i] + (trajectory.omega[j] - trajectory.omega[i]) * t
+        state[ACCL] = trajectory.accL[i] + (trajectory.accL[j] - trajectory.accL[i]) * t
+        state[ACCR] = trajectory.accR[i] + (trajectory.accR[j] - trajectory.accR[i]) * t
+
+        state[SIN] = trajectory.sin[i] + (trajectory.sin[j] - trajectory.sin[i]) * t
+        state[COS] = trajectory.cos[i] + (trajectory.cos[j] - trajectory.cos[i]) * t
+        state[SPEEDL] = trajectory.speedL[i] + (trajectory.speedL[j] - trajectory.speedL[i]) * t
+        state[SPEEDR] = trajectory.speedR[i] + (trajectory.speedR[j] - trajectory.speedR[i]) * t
+        state[DUTYL] = trajectory.dutyL[i] + (trajectory.dutyL[j] - trajectory.dutyL[i]) * t
+        state[DUTYR] = trajectory.dutyR[i] + (trajectory.dutyR[j] - trajectory.dutyR[i]) * t
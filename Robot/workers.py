@@ -0,0 +1,162 @@
+import micropython
+from _thread import allocate_lock
+from time import time, sleep
+from mytools import thread
+
+
+class Job:
+    """
+    Job class
+    Handle of a job submitted to a worker pool.
+    Parameters:
+        func: function
+        args: tuple
+        kwargs: dict
+        runID: int - Run the job belongs to, None if it belongs to no run
+    """
+
+    def __init__(self, func: object, args: tuple, kwargs: dict, runID: int = None):
+
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.runID = runID
+
+        self.done = False
+        self.cancelled = False
+        self.result = None
+        self.error = None
+
+    @micropython.native
+    def cancel(self) -> None:
+        """
+        Cancels the job if it did not start yet.
+        """
+        self.cancelled = True
+
+    @micropython.native
+    def join(self, timeout: float = None, poll: float = 0.005) -> bool:
+        """
+        Waits for the job to finish or be cancelled.
+        Parameters:
+            timeout: float - Max time to wait, None waits forever
+            poll: float - Poll time
+        Returns:
+            done: bool - If the job finished
+        """
+        st = time()
+        while not self.done and not self.cancelled:
+            if timeout is not None and time() - st >= timeout:
+                break
+            sleep(poll)
+        return self.done
+
+
+class WorkerPool:
+    """
+    WorkerPool class
+    A fixed number of worker threads running jobs from a bounded queue.
+    Threads are created once, so running a job never creates a thread.
+    Jobs can be cancelled one by one or by run ID.
+    Parameters:
+        workers: int - Number of worker threads
+        size: int - Queue capacity
+        poll: float - Idle worker poll time in seconds
+    """
+
+    def __init__(self, workers: int, size: int, poll: float = 0.002):
+
+        self.size = size
+        self.poll = poll
+
+        self.lock = allocate_lock()
+        self.queue = [None] * size
+        # Run the jobs submitted without a run ID belong to, set by the runner
+        self.runID = None
+        self.head = 0
+        self.count = 0
+
+        self.run = True
+        for _ in range(workers):
+            self.worker()
+
+    @micropython.native
+    def submit(self, func: object, args: tuple = (), kwargs: dict = None, runID: int = None) -> Job:
+        """
+        Queues a job, waits for space if the queue is full.
+        Parameters:
+            func: function
+            args: tuple
+            kwargs: dict
+            runID: int - Run the job belongs to, the pool's current run by default
+        Returns:
+            job: Job - Job handle
+        """
+        job = Job(func, args, kwargs or {}, self.runID if runID is None else runID)
+        while True:
+            with self.lock:
+                if self.count < self.size:
+                    self.queue[(self.head + self.count) % self.size] = job
+                    self.count += 1
+                    return job
+            sleep(self.poll)
+
+    @micropython.native
+    def cancel(self, runID: int) -> None:
+        """
+        Cancels the queued jobs of a run.
+        Jobs that belong to no run are never cancelled.
+        Parameters:
+            runID: int
+        """
+        if runID is None:
+            return
+        with self.lock:
+            for index in range(self.count):
+                job = self.queue[(self.head + index) % self.size]
+                if job.runID == runID:
+                    job.cancel()
+
+    @micropython.native
+    def take(self) -> Job:
+        """
+        Takes the oldest job from the queue.
+        Returns:
+            job: Job - None if the queue is empty
+        """
+        with self.lock:
+            if self.count == 0:
+                return None
+            job = self.queue[self.head]
+            self.queue[self.head] = None
+            self.head = (self.head + 1) % self.size
+            self.count -= 1
+            return job
+
+    @micropython.native
+    @thread
+    def worker(self) -> None:
+        """
+        Runs jobs until the pool is stopped.
+        Runs as thread.
+        """
+        while self.run:
+            job = self.take()
+            if job is None:
+                sleep(self.poll)
+                continue
+            if job.cancelled:
+                continue
+            try:
+                job.result = job.func(*job.args, **job.kwargs)
+            except Exception as e:
+                job.error = e
+                print("Job failed:", e)
+            job.done = True
+
+    @micropython.native
+    def stop(self) -> None:
+        """
+        Stops the worker threads once they finish their jobs.
+        """
+        self.run = False
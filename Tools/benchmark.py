@@ -0,0 +1,370 @@
+import gc
+import sys
+from json import load, dump
+
+from os import listdir
+
+try:
+    from os import getenv
+except ImportError:
+    def getenv(key): return None
+
+TOOLS = __file__.rsplit("/", 1)[0] if "/" in __file__ else "."
+ROBOT = TOOLS + "/../Robot"
+PATHS = ROBOT + "/Paths/"
+CONFIG = ROBOT + "/config.json"
+
+sys.path.insert(0, ROBOT)
+
+try:
+    import micropython  # noqa: F401
+except ImportError:
+    # CPython
+    from simulator import micropythonModule
+    sys.modules["micropython"] = micropythonModule()
+
+try:
+    from time import ticks_us, ticks_diff
+except ImportError:
+    # CPython, microseconds as floats so sub microsecond calls are not rounded to 0
+    from time import perf_counter
+
+    def ticks_us(): return perf_counter()*1000000
+    def ticks_diff(ticks1, ticks2): return ticks1 - ticks2
+
+from mytools import zeros  # noqa: E402
+from pathfile import PathFile, PathCache  # noqa: E402
+from trajectory import TrajectorySampler  # noqa: E402
+from controllers import PIDController, RAMSETEController  # noqa: E402
+from kernels import odometryStep  # noqa: E402
+
+USAGE = """Usage:
+    benchmark.py [-n iterations] [-o results.json] [-p path]... [benchmark ...]
+    benchmark.py --compare old.json new.json
+
+Path benchmarks run on every Robot/Paths file, or on the -p paths.
+Devices are benchmarked against the fake sysfs tree EV3_SYSFS_ROOT points to,
+under CPython a static tree is built when it is not set."""
+
+
+def percentile(values, p):
+    """
+    Parameters:
+        values: list - Sorted values
+        p: float - Percentile [0, 100]
+    Returns:
+        value
+    """
+    return values[min(len(values) - 1, int(len(values)*p/100))]
+
+
+def allocated(func, calls):
+    """
+    Returns the bytes allocated per call.
+    MicroPython: heap growth over the calls, with the collector disabled.
+    CPython: the largest transient allocation of a call (tracemalloc peak),
+        CPython frees objects as they die so the total is not observable.
+    Parameters:
+        func: function
+        calls: int
+    Returns:
+        bytes: float
+    """
+    if hasattr(gc, "mem_alloc"):
+        gc.collect()
+        gc.disable()
+        st = gc.mem_alloc()
+        for _ in range(calls):
+            func()
+        size = gc.mem_alloc() - st
+        gc.enable()
+        return size / calls
+
+    import tracemalloc
+    tracemalloc.start()
+    size = 0
+    for _ in range(calls):
+        tracemalloc.reset_peak()
+        current = tracemalloc.get_traced_memory()[0]
+        func()
+        size = max(size, tracemalloc.get_traced_memory()[1] - current)
+    tracemalloc.stop()
+    return size
+
+
+def measure(func, iterations):
+    """
+    Benchmarks a function.
+    Parameters:
+        func: function - Called without arguments
+        iterations: int
+    Returns:
+        result: dict - ops (per second), p50, p90, p99, max (microseconds per call), alloc (bytes per call)
+    """
+    for _ in range(min(iterations, 10)):
+        func()
+
+    gc.collect()
+    st = ticks_us()
+    for _ in range(iterations):
+        func()
+    total = ticks_diff(ticks_us(), st)
+
+    latencies = [0] * iterations
+    for i in range(iterations):
+        st = ticks_us()
+        func()
+        latencies[i] = ticks_diff(ticks_us(), st)
+    latencies.sort()
+
+    return {"ops": iterations / total * 1000000 if total > 0 else 0,
+            "p50": percentile(latencies, 50), "p90": percentile(latencies, 90),
+            "p99": percentile(latencies, 99), "max": latencies[-1],
+            "alloc": allocated(func, min(iterations, 100))}
+
+
+def cycle(func, values):
+    """
+    Returns a function calling func with the next of values on every call.
+    The values are prepared up front, so the benchmark loop does not allocate them.
+    """
+    state = [0]
+    count = len(values)
+
+    def call():
+        i = state[0]
+        func(values[i])
+        state[0] = i + 1 if i + 1 < count else 0
+    return call
+
+
+def pathNames():
+    """
+    Returns the names of all the path files.
+    Returns:
+        names: list
+    """
+    return sorted(filename[:-len(".path")] for filename in listdir(PATHS) if filename.endswith(".path"))
+
+
+def pathBenchmarks(name):
+    """
+    Returns the benchmarks of loading and sampling a path.
+    Parameters:
+        name: str - Path name
+    Returns:
+        benchmarks: list - (name, function, iterations scale)
+    """
+    filename = PATHS + name + ".path"
+
+    def loadPath():
+        path = PathFile(filename)
+        path.get(0)
+
+    def loadEvents():
+        with open(PATHS + name + ".events", "r") as f:
+            load(f)
+
+    cache = PathCache(1 << 20)
+
+    def loadCached():
+        cache.get(name, filename).get(0)
+
+    # Every spline, sampled at 100 times each
+    path = PathFile(filename)
+    samples = []
+    for index in range(len(path)):
+        spline = path.get(index)
+        sampler = TrajectorySampler(spline)
+        duration = spline.time[spline.size - 1]
+        samples += [(sampler, duration * i / 100) for i in range(100)]
+
+    return [
+        ("load", loadPath, 0.05),
+        ("load.events", loadEvents, 0.05),
+        ("load.cached", loadCached, 1),
+        ("sampler.sample", cycle(lambda sample: sample[0].sample(sample[1]), samples), 1),
+    ]
+
+
+def controlBenchmarks(name):
+    """
+    Returns the benchmarks of the control code.
+    Parameters:
+        name: str - Path the targets are sampled from
+    Returns:
+        benchmarks: list - (name, function, iterations scale)
+    """
+    spline = PathFile(PATHS + name + ".path").get(0)
+    duration = spline.time[spline.size - 1]
+    sampler = TrajectorySampler(spline)
+
+    # Targets along the spline and poses off them
+    targets, poses = [], []
+    for i in range(50):
+        sampler.sample(duration * i / 50)
+        target = zeros(len(sampler.state))
+        for j in range(len(target)):
+            target[j] = sampler.state[j]
+        pose = zeros(3)
+        pose[0], pose[1], pose[2] = target[0] + 1.5, target[1] - 1, target[2] + 0.05
+        targets.append(target)
+        poses.append(pose)
+    pairs = list(zip(poses, targets))
+
+    RAMSETE = RAMSETEController(0.025, 0.7, 4.375, 25.4469)
+    out = zeros(4)
+    legacy = [(target[0] - pose[0], target[1] - pose[1], pose[2], target[3], target[4], target[2])
+              for pose, target in pairs]
+
+    PID = PIDController(3.75, 0, 0.03, 0)
+    feedbacks = [(i - 50) / 10 for i in range(100)]
+
+    odometry = zeros(3)
+    steps = [(0.1 + i / 1000, i / 100) for i in range(600)]
+
+    return [
+        ("baseline", lambda: None, 1),
+        ("ramsete.correction", cycle(lambda args: RAMSETE.correction(*args), legacy), 1),
+        ("ramsete.correctionInto", cycle(lambda pair: RAMSETE.correctionInto(pair[0], pair[1], out), pairs), 1),
+        ("ramsete.feedforwardInto", cycle(lambda pair: RAMSETE.feedforwardInto(pair[0], pair[1], out), pairs), 1),
+        ("pid.correction", cycle(PID.correction, feedbacks), 1),
+        ("odometry.step", cycle(lambda step: odometryStep(odometry, step[0], step[1]), steps), 1),
+    ]
+
+
+def deviceBenchmarks():
+    """
+    Returns the benchmarks of the device I/O, on a fake sysfs tree.
+    Returns:
+        benchmarks: list - (name, function, iterations scale), empty without a tree
+    """
+    if not getenv("EV3_SYSFS_ROOT"):
+        try:
+            import os
+            from atexit import register
+            from shutil import rmtree
+            from tempfile import mkdtemp
+            from json import loads
+            from fakeSysfs import build
+        except ImportError:
+            print("EV3_SYSFS_ROOT is not set, skipping the device benchmarks")
+            return []
+        root = mkdtemp(prefix="ev3sysfs")
+        register(rmtree, root, True)
+        with open(CONFIG, "r") as f:
+            build(root, loads(f.read()))
+        os.environ["EV3_SYSFS_ROOT"] = root
+
+    from config import config
+    from ev3devices import Motor, Gyro, LightSensor
+
+    robot = config(CONFIG)
+    motor = Motor(robot.drivebase.motor.left)
+    gyro = Gyro(robot.gyro.S1)
+    light = LightSensor(robot.light.SL)
+
+    return [
+        ("motor.count", motor.count, 1),
+        ("motor.frequency", motor.frequency, 1),
+        # Alternating values, so every call writes
+        ("motor.dutyCycle", cycle(motor.dutyCycle, [10, 20]), 1),
+        ("gyro.read", gyro.read, 1),
+        ("light.read", light.read, 1),
+    ]
+
+
+def flatten(results):
+    """
+    Returns the results of a result file keyed by benchmark, path benchmarks as path/benchmark.
+    """
+    flat = dict(results["results"])
+    for name, benchmarks in results["paths"].items():
+        for bench, result in benchmarks.items():
+            flat[name + "/" + bench] = result
+    return flat
+
+
+def compare(old, new):
+    """
+    Prints the change between two result files.
+    """
+    with open(old, "r") as f:
+        old = flatten(load(f))
+    with open(new, "r") as f:
+        new = flatten(load(f))
+
+    print("{:<26}{:>12}{:>12}{:>9}{:>10}{:>10}{:>9}{:>9}".format(
+        "benchmark", "old ops/s", "new ops/s", "speedup", "old p50", "new p50", "old B", "new B"))
+    for name in new:
+        if name not in old:
+            continue
+        a, b = old[name], new[name]
+        print("{:<26}{:>12.0f}{:>12.0f}{:>8.2f}x{:>10.1f}{:>10.1f}{:>9.0f}{:>9.0f}".format(
+            name, a["ops"], b["ops"], b["ops"] / a["ops"] if a["ops"] else 0,
+            a["p50"], b["p50"], a["alloc"], b["alloc"]))
+
+
+def run(benchmarks, iterations, selected, prefix=""):
+    """
+    Runs and prints benchmarks.
+    Parameters:
+        benchmarks: list - (name, function, iterations scale)
+        iterations: int
+        selected: list - Benchmark names to run, all if empty
+        prefix: str - Printed before the names
+    Returns:
+        results: dict - Benchmark name to result
+    """
+    results = {}
+    for bench, func, scale in benchmarks:
+        if selected and bench not in selected:
+            continue
+        result = measure(func, max(int(iterations*scale), 10))
+        results[bench] = result
+        print("{:<26}{:>12.0f}{:>9.1f}{:>9.1f}{:>9.1f}{:>9.1f}{:>9.0f}".format(
+            prefix + bench, result["ops"], result["p50"], result["p90"], result["p99"], result["max"], result["alloc"]))
+    return results
+
+
+def main():
+
+    args = sys.argv[1:]
+    if "-h" in args or "--help" in args:
+        print(USAGE)
+        return
+    if args and args[0] == "--compare":
+        compare(args[1], args[2])
+        return
+
+    iterations, output, names, selected = 2000, None, [], []
+    while args:
+        arg = args.pop(0)
+        if arg == "-n":
+            iterations = int(args.pop(0))
+        elif arg == "-o":
+            output = args.pop(0)
+        elif arg == "-p":
+            names.append(args.pop(0))
+        else:
+            selected.append(arg)
+    names = names or pathNames()
+
+    implementation = sys.implementation.name
+    output = output or "benchmark-{}.json".format(implementation)
+
+    print("{:<26}{:>12}{:>9}{:>9}{:>9}{:>9}{:>9}".format(
+        "benchmark", "ops/s", "p50 us", "p90 us", "p99 us", "max us", "alloc B"))
+    paths = {}
+    for name in names:
+        paths[name] = run(pathBenchmarks(name), iterations, selected, name + "/")
+    results = run(controlBenchmarks(names[0]) + deviceBenchmarks(), iterations, selected)
+
+    with open(output, "w") as f:
+        dump({"implementation": implementation, "version": sys.version,
+              "iterations": iterations, "results": results, "paths": paths}, f)
+    print("Results:", output)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,158 +1,345 @@
-from math import sin, cos, pi
-from json import loads
+from argparse import ArgumentParser
+from ast import parse, literal_eval
+from binascii import crc32
+from concurrent.futures import ProcessPoolExecutor
+from hashlib import sha1
+from json import loads, dumps, dump
+from struct import pack
+from time import perf_counter
+import numpy as np
 import os
-mainpath = os.path.dirname(os.getcwd())
+import sys
 
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
-with open("currentPath.txt", 'r') as f:
-    filename = f.read()
+sys.path.append(os.path.join(ROOT, "Robot"))
+from registry import COMMANDS  # noqa: E402
 
-path_to_JSON = mainpath + f'\FLL\deploy\pathplanner\generatedJSON\{filename}.wpilib.json'
-path_to_Rfile = mainpath + f'\FLL\deploy\pathplanner\{filename}.path'
-path_to_Wfile = mainpath + f'\FLL\Robot\Paths\{filename}'
+PLANNER = os.path.join(ROOT, "deploy", "pathplanner")
+GENERATED = os.path.join(PLANNER, "generatedJSON")
+OUTPUT = os.path.join(ROOT, "Robot", "Paths")
+CONFIG = os.path.join(ROOT, "Robot", "config.json")
+# Command IDs in the built events are indices into its COMMANDS
+REGISTRY = os.path.join(ROOT, "Robot", "registry.py")
+CACHE = os.path.join(ROOT, "Tools", ".buildcache.json")
 
 resolution = 0.004
 unitsScale = 100
 
-with open("Robot/config.json", "r") as f:
-    config = loads(f.read())
-
-with open(path_to_Rfile, 'r') as f:
-    points = loads(f.read())
-with open(path_to_JSON, 'r') as f:
-    waypoints = loads(f.read())
-
-# {"Time": [], 'x': [], 'y': [], "theata": [], "V": [], "omega": [], "accL": [], "accR": []}
-path = []
-segment = []
-new_waypoint = {}
-
-StopPoint = False
-
-Vl, Vr = 0, 0
-
-# Waypoints
-
-for index, waypoint in enumerate(waypoints):
-
-    if waypoint['velocity'] == 0:
-        if StopPoint:
-            path.append(segment)
-            segment = []
-            StopPoint = False
+# Binary path format, must match Robot/pathfile.py
+MAGIC = b'FLLP'
+VERSION = 4
+FIELDS = 14
+HEADER = '<4sHHHHI'
+
+
+def configChecksum(config):
+    """
+    Returns the checksum of the robot constants the feedforward columns depend on.
+    Must match Robot/pathfile.py configChecksum.
+    Parameters:
+        config: dict - Robot config
+    Returns:
+        checksum: int - 16 bits
+    """
+    return crc32(pack('<8f', config["wheel"]["circumference"], config["drivebase"]["halfDBM"],
+                      *config["drivebase"]["motor"]["left"]["ff"], *config["drivebase"]["motor"]["right"]["ff"])) & 0xFFFF
+
+
+def configKey(config):
+    """
+    Returns the part of the robot config a path depends on.
+    Parameters:
+        config: dict - Robot config
+    Returns:
+        key: dict
+    """
+    return {"length": config["robot"]["length"], "wheelAxis": config["robot"]["wheelAxis"],
+            "circumference": config["wheel"]["circumference"], "halfDBM": config["drivebase"]["halfDBM"],
+            "ffL": config["drivebase"]["motor"]["left"]["ff"], "ffR": config["drivebase"]["motor"]["right"]["ff"]}
+
+
+def compileCommand(name, args):
+    """
+    Compiles a PathPlanner event command to a command ID and its arguments.
+    Parameters:
+        name: str - Command name, e.g. 'runner.rm.RunTime'
+        args: str - Arguments, e.g. '(300, 0.3, wait=False)'
+    Returns:
+        command: [int, list, dict] - ID, args, kwargs
+    """
+    if name not in COMMANDS:
+        raise ValueError(f"Unknown command: {name}")
+
+    call = parse(f"command{args}", mode='eval').body
+    return [COMMANDS.index(name),
+            [literal_eval(arg) for arg in call.args],
+            {keyword.arg: literal_eval(keyword.value) for keyword in call.keywords}]
+
+
+def forwardFill(values, valid):
+    """
+    Replaces the invalid values by the last valid value before them, 0 if there is none.
+    Parameters:
+        values: np.ndarray
+        valid: np.ndarray - bool
+    Returns:
+        values: np.ndarray
+    """
+    last = np.maximum.accumulate(np.where(valid, np.arange(len(values)), -1))
+    return np.where(last >= 0, values[np.maximum(last, 0)], 0)
+
+
+def waypointColumns(waypoints, config):
+    """
+    Computes the path columns of all the waypoints.
+    Parameters:
+        waypoints: list - WPILib trajectory states
+        config: dict - Robot config
+    Returns:
+        columns: np.ndarray - FIELDS x waypoints, in the path file column order
+    """
+    time = np.array([waypoint['time'] for waypoint in waypoints])
+    x = np.array([waypoint['pose']['translation']['x'] for waypoint in waypoints])*unitsScale
+    y = np.array([waypoint['pose']['translation']['y'] for waypoint in waypoints])*unitsScale
+    rotation = np.array([waypoint['pose']['rotation']['radians'] for waypoint in waypoints])
+    V = np.array([waypoint['velocity'] for waypoint in waypoints])*unitsScale
+    omega = np.array([waypoint['angularVelocity'] for waypoint in waypoints])
+
+    # The path is planned for the robot's center, the robot tracks its wheel axis
+    offset = config["robot"]["length"]/2 - config["robot"]["wheelAxis"]
+    x = x + offset*np.cos(rotation)
+    y = y + offset*np.sin(rotation)
+
+    theata = np.where(rotation < 0, rotation + 2*np.pi, rotation)
+
+    halfDBM = config["drivebase"]["halfDBM"]
+    Vl, Vr = V - omega*halfDBM, V + omega*halfDBM
+
+    # Acceleration towards the next waypoint, from the wheel speeds of the last waypoint with a time step.
+    # Waypoints without a time step keep the previous acceleration, the last waypoint has none.
+    dt = np.diff(time)
+    valid = dt != 0
+    last = np.maximum.accumulate(np.where(valid, np.arange(1, len(time)), 0))
+    prev = np.concatenate(([0], last[:-1]))
+    safe = np.where(valid, dt, 1)
+    accL = np.zeros(len(time))
+    accR = np.zeros(len(time))
+    accL[:-1] = forwardFill((Vl[1:] - np.where(prev > 0, Vl[prev], 0))/safe, valid)
+    accR[:-1] = forwardFill((Vr[1:] - np.where(prev > 0, Vr[prev], 0))/safe, valid)
+
+    # Feedforward in motor degrees
+    scale = 360/config["wheel"]["circumference"]
+    speedL, speedR = Vl*scale, Vr*scale
+    KsL, KvL, KaL = config["drivebase"]["motor"]["left"]["ff"]
+    KsR, KvR, KaR = config["drivebase"]["motor"]["right"]["ff"]
+    dutyL = KsL*np.sign(speedL) + KvL*speedL + KaL*accL*scale
+    dutyR = KsR*np.sign(speedR) + KvR*speedR + KaR*accR*scale
+
+    return np.array([time, x, y, theata, V, omega, accL, accR,
+                     np.sin(theata), np.cos(theata), speedL, speedR, dutyL, dutyR])
+
+
+def splitPoints(velocity):
+    """
+    Returns where the path splits into splines, at every second consecutive stop.
+    Parameters:
+        velocity: list - Waypoint velocities
+    Returns:
+        splits: list - Index of the first waypoint of every spline but the first
+    """
+    splits = []
+    stopPoint = False
+    for index, V in enumerate(velocity):
+        if V == 0:
+            if stopPoint:
+                splits.append(index)
+            stopPoint = not stopPoint
         else:
-            StopPoint = True
-    else:
-        StopPoint = False
+            stopPoint = False
+    return splits
 
-    # Time
-    new_waypoint["time"] = waypoint["time"]
 
-    # Coords
-    x, y = waypoint['pose']['translation']['x']*unitsScale, waypoint['pose']['translation']['y']*unitsScale
-    l = config["robot"]["length"]/2 - config["robot"]["wheelAxis"]  # noqa
-    newX, newY = x + l * cos(waypoint['pose']['rotation']['radians']), y + l * sin(waypoint['pose']['rotation']['radians'])
+def compileEvents(points, splines):
+    """
+    Compiles the stop events and the markers of a path.
+    Parameters:
+        points: dict - PathPlanner path
+        splines: list - Spline columns
+    Returns:
+        stopEvents: list
+        markers: list - Per spline, [time, commands] markers
+    """
+    skip = [0]
 
-    new_waypoint["x"] = newX
-    new_waypoint["y"] = newY
+    stopEvents = []
+    for index, point in enumerate(points["waypoints"]):
+        if point["isStopPoint"] or point["isReversal"] or index == 0 or index == len(points["waypoints"])-1:
 
-    # Theata
-    theata = waypoint['pose']['rotation']['radians']
-    if (theata < 0):
-        theata += 2*pi
+            names = point["stopEvent"]["names"]
+            commands = [compileCommand(name, args) for name, args in zip(names[::2], names[1::2])]
 
-    new_waypoint["theata"] = theata
+            stopEvent = point["stopEvent"]
+            stopEvents.append({"commands": commands, "executionBehavior": stopEvent["executionBehavior"],
+                               "waitTime": stopEvent["waitTime"], "waitBehavior": stopEvent["waitBehavior"]})
 
-    # Velocity
-    V = waypoint['velocity']*unitsScale
-    new_waypoint["V"] = V
-
-    # Omega
-    new_waypoint["omega"] = waypoint['angularVelocity']
-
-    # Acc
-    if index == len(waypoints)-1:
-        new_waypoint["accL"] = 0
-        new_waypoint["accR"] = 0
-    else:
-        nextWaypoint = waypoints[index+1]
-        dt = nextWaypoint['time'] - waypoint['time']
-
-        if dt == 0:
-            if len(segment) > 0:
-                new_waypoint["accL"] = segment[-1]['accL']
-                new_waypoint["accR"] = segment[-1]['accR']
-            else:
-                new_waypoint["accL"] = path[-1][-1]['accL']
-                new_waypoint["accR"] = path[-1][-1]['accR']
+            skip.append(skip[-1])
 
         else:
-            nextV = nextWaypoint['velocity']*unitsScale
-            nextOmega = nextWaypoint['angularVelocity']
-            nextVl = nextV - nextOmega*config["drivebase"]["halfDBM"]
-            nextVr = nextV + nextOmega*config["drivebase"]["halfDBM"]
-
-            accL = (nextVl - Vl) / dt
-            accR = (nextVr - Vr) / dt
-
-            new_waypoint["accL"] = accL
-            new_waypoint["accR"] = accR
-
-            Vl, Vr = nextVl, nextVr
-
-    segment.append(new_waypoint)
-    new_waypoint = {}
-
-path.append(segment)
-
-# Stop Events
-
-skip = [0]
-
-stopEvents = []
-for index, point in enumerate(points["waypoints"]):
-    if point["isStopPoint"] or point["isReversal"] or index == 0 or index == len(points["waypoints"])-1:
-
-        commands = []
-        for _index, i in enumerate(point["stopEvent"]["names"][::2]):
-            commands.append(f"{i}{point['stopEvent']['names'][_index*2+1]}")
-
-        executionBehavior = point["stopEvent"]["executionBehavior"]
-
-        waitTime = point["stopEvent"]["waitTime"]
-        waitBehavior = point["stopEvent"]["waitBehavior"]
-
-        stopEvents.append({"commands": commands, "executionBehavior": executionBehavior,
-                           "waitTime": waitTime, "waitBehavior": waitBehavior})
-
-        skip.append(skip[-1])
-
+            skip.append(skip[-1]+1)
+
+    markers = [[] for _ in range(len(stopEvents)-1)]
+    for marker in points["markers"]:
+
+        names = marker["names"]
+        commands = [compileCommand(name, args) for name, args in zip(names[::2], names[1::2])]
+
+        spline_index = int(marker['position'])
+        index = round(marker['position'] - spline_index, 3) * (1/resolution)
+        spline = spline_index - skip[spline_index]
+        waypoint = int(index + (skip[spline_index+1] - skip[spline_index])*(1/resolution))
+
+        markers[spline].append([float(splines[spline][0][waypoint]), commands])
+
+    return stopEvents, markers
+
+
+def writePath(filename, splines, checksum):
+    """
+    Writes a path in the binary path format.
+    Parameters:
+        filename: str
+        splines: list - Splines, each a FIELDS x waypoints array
+        checksum: int - configChecksum of the robot config
+    """
+    # Column per field, so the robot can read every column into its own array
+    data = [np.ascontiguousarray(spline, dtype='<f4').tobytes() for spline in splines]
+    index = b''.join(pack('<II', spline.shape[1], crc32(columns)) for spline, columns in zip(splines, data))
+
+    with open(filename, 'wb') as f:
+        f.write(pack(HEADER, MAGIC, VERSION, FIELDS, len(splines), checksum, crc32(index)))
+        f.write(index)
+        for columns in data:
+            f.write(columns)
+
+
+def inputs(name):
+    """
+    Returns the input files of a path.
+    Parameters:
+        name: str - Path name
+    Returns:
+        path: str - PathPlanner path
+        trajectory: str - Generated WPILib trajectory
+    """
+    return os.path.join(PLANNER, f"{name}.path"), os.path.join(GENERATED, f"{name}.wpilib.json")
+
+
+def discover():
+    """
+    Returns the names of all the paths that have a generated trajectory.
+    Returns:
+        names: list
+    """
+    return sorted(filename[:-len(".path")] for filename in os.listdir(PLANNER)
+                  if filename.endswith(".path") and os.path.exists(inputs(filename[:-len(".path")])[1]))
+
+
+def inputsHash(name, config):
+    """
+    Returns the hash of everything a path is built from.
+    Parameters:
+        name: str - Path name
+        config: dict - Robot config
+    Returns:
+        hash: str
+    """
+    digest = sha1()
+    for filename in (__file__, REGISTRY) + inputs(name):
+        with open(filename, 'rb') as f:
+            digest.update(f.read())
+    digest.update(dumps(configKey(config), sort_keys=True).encode())
+    return digest.hexdigest()
+
+
+def build(name, config, output):
+    """
+    Builds a path and its events.
+    Parameters:
+        name: str - Path name
+        config: dict - Robot config
+        output: str - Output directory
+    Returns:
+        name: str
+        duration: float - Build time in seconds
+    """
+    st = perf_counter()
+
+    pathFile, trajectoryFile = inputs(name)
+    with open(pathFile, 'r') as f:
+        points = loads(f.read())
+    with open(trajectoryFile, 'r') as f:
+        waypoints = loads(f.read())
+
+    columns = waypointColumns(waypoints, config)
+    splines = np.split(columns, splitPoints([waypoint['velocity'] for waypoint in waypoints]), axis=1)
+
+    stopEvents, markers = compileEvents(points, splines)
+
+    with open(os.path.join(output, f"{name}.events"), 'w') as f:
+        dump({"stopEvents": stopEvents, "markers": markers}, f)
+
+    writePath(os.path.join(output, f"{name}.path"), splines, configChecksum(config))
+
+    return name, perf_counter() - st
+
+
+def main():
+
+    parser = ArgumentParser(description="Builds PathPlanner paths into robot path and events files.")
+    parser.add_argument("names", nargs="*", help="Paths to build, all the paths by default")
+    parser.add_argument("--config", default=CONFIG, help="Robot config")
+    parser.add_argument("--output", default=OUTPUT, help="Output directory")
+    parser.add_argument("--force", action="store_true", help="Rebuild paths that did not change")
+    parser.add_argument("--jobs", type=int, default=None, help="Build processes")
+    args = parser.parse_args()
+
+    st = perf_counter()
+
+    with open(args.config, 'r') as f:
+        config = loads(f.read())
+
+    try:
+        with open(CACHE, 'r') as f:
+            cache = loads(f.read())
+    except (OSError, ValueError):
+        cache = {}
+    built = cache.setdefault(os.path.abspath(args.output), {})
+
+    names = args.names or discover()
+    hashes = {name: inputsHash(name, config) for name in names}
+    stale = [name for name in names if args.force or built.get(name) != hashes[name] or
+             not all(os.path.exists(os.path.join(args.output, name + ext)) for ext in (".path", ".events"))]
+
+    for name in names:
+        if name not in stale:
+            print(f"{name}: up to date")
+
+    if len(stale) > 1 and args.jobs != 1:
+        with ProcessPoolExecutor(args.jobs) as pool:
+            results = list(pool.map(build, stale, [config]*len(stale), [args.output]*len(stale)))
     else:
-        skip.append(skip[-1]+1)
-
-# Markers
-
-markers = [[] for _ in range(len(stopEvents)-1)]
-for marker in points["markers"]:
-
-    commands = []
-    for index, i in enumerate(marker["names"][::2]):
-        commands.append(f"{i}{marker['names'][index*2+1]}")
+        results = [build(name, config, args.output) for name in stale]
 
-    spline_index = int(marker['position'])
-    index = round(marker['position'] - spline_index, 3) * (1/resolution)
-    time = path[spline_index-skip[spline_index]][int(index + (skip[spline_index+1] - skip[spline_index])*(1/resolution))]['time']
+    for name, duration in results:
+        built[name] = hashes[name]
+        print(f"{name}: built in {duration*1000:.0f}ms")
 
-    markers[spline_index-skip[spline_index]].append((time, commands))
+    with open(CACHE, 'w') as f:
+        dump(cache, f, indent=4)
 
-# Write Files
+    print(f"Built {len(stale)}/{len(names)} paths in {(perf_counter() - st)*1000:.0f}ms")
 
-with open(path_to_Wfile+".events", 'w') as f:
-    f.write(str((stopEvents, markers)))
 
-with open(path_to_Wfile+".path", 'w') as f:
-    tmp = [[] for _ in range(len(path))]
-    for index, spline in enumerate(path):
-        for waypoint in spline:
-            tmp[index].append(list(waypoint.values()))
-    f.write(str(tmp))
+if __name__ == "__main__":
+    main()
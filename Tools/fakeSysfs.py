@@ -0,0 +1,184 @@
+from argparse import ArgumentParser
+from json import loads
+from math import sin
+from multiprocessing import Process
+from time import perf_counter, sleep
+import os
+
+from simulator import CONFIG, VirtualClock, World
+
+MOTOR_PORTS = "ABCD"
+SENSOR_PORTS = "1234"
+
+# Known attribute values, a shorter value written over a longer one leaves its tail in a regular file
+COMMANDS = ("run-direct", "stop", "reset")
+MODES = ("GYRO-ANG", "GYRO-RATE", "GYRO-G&A", "GYRO-CAL", "COL-REFLECT", "COL-COLOR", "COL-AMBIENT")
+
+
+def paths(root):
+    """
+    Returns the directories of the tree.
+    Tacho motor n is port n ('A' is 0) and sensor n is port n+1.
+    Parameters:
+        root: str - Tree root, the robot reads it from EV3_SYSFS_ROOT
+    Returns:
+        motors: list - Tacho motor directories
+        sensors: list - Lego sensor directories
+        iio: str - Tacho counters directory
+    """
+    motors = [os.path.join(root, "sys", "class", "tacho-motor", f"motor{n}") for n in range(len(MOTOR_PORTS))]
+    sensors = [os.path.join(root, "sys", "class", "lego-sensor", f"sensor{n}") for n in range(len(SENSOR_PORTS))]
+    return motors, sensors, os.path.join(root, "sys", "bus", "iio", "devices", "iio:device1")
+
+
+def write(path, value):
+    """
+    Writes an attribute in place, so open readers keep reading it.
+    """
+    with open(path, 'w') as f:
+        f.write(f"{value}\n")
+
+
+def read(path, values=None):
+    """
+    Reads an attribute.
+    Parameters:
+        path: str
+        values: tuple - Known values, None for an integer
+    Returns:
+        value: int or str, None if the attribute holds no known value
+    """
+    with open(path, 'r') as f:
+        data = f.read().strip()
+    if values is None:
+        try:
+            return int(data.split()[0])
+        except (IndexError, ValueError):
+            return None
+    matches = [value for value in values if data.startswith(value)]
+    return max(matches, key=len) if matches else None
+
+
+def build(root, config):
+    """
+    Builds an ev3dev sysfs tree with every motor and sensor port connected.
+    Parameters:
+        root: str
+        config: dict - Robot config, the gyro ports start in the configured mode
+    """
+    motors, sensors, iio = paths(root)
+    gyros = {gyro["port"]: gyro.get("mode", "GYRO-ANG") for gyro in config["gyro"].values()}
+
+    for port, directory in zip(MOTOR_PORTS, motors):
+        os.makedirs(directory, exist_ok=True)
+        write(os.path.join(directory, "address"), f"ev3-ports:out{port}")
+        write(os.path.join(directory, "duty_cycle_sp"), 0)
+        write(os.path.join(directory, "command"), "stop")
+
+    for port, directory in zip(SENSOR_PORTS, sensors):
+        os.makedirs(directory, exist_ok=True)
+        write(os.path.join(directory, "address"), f"ev3-ports:in{port}")
+        write(os.path.join(directory, "mode"), gyros.get(port, "COL-REFLECT"))
+        write(os.path.join(directory, "value0"), 0)
+        write(os.path.join(directory, "value1"), 0)
+
+    os.makedirs(iio, exist_ok=True)
+    for n in range(len(MOTOR_PORTS)):
+        write(os.path.join(iio, f"in_count{n}_raw"), 0)
+        write(os.path.join(iio, f"in_frequency{n}_input"), 0)
+
+
+def animate(root, config, rate=200, duration=None, drive=0):
+    """
+    Animates a tree built by build.
+    The written duty cycles drive the simulator's motor and robot model,
+    the counts, frequencies and gyro values follow it, the light sensors sweep 10-90.
+    Parameters:
+        root: str
+        config: dict - Robot config
+        rate: float - Updates per second
+        duration: float - Seconds to run, None to run until killed
+        drive: int - Duty cycle the drive motors start at, so the values change without a robot program
+    """
+    motors, sensors, iio = paths(root)
+
+    world = World(config, VirtualClock(1))
+    if drive:
+        for motor in (config["drivebase"]["motor"]["left"], config["drivebase"]["motor"]["right"]):
+            write(os.path.join(motors[MOTOR_PORTS.index(motor["port"])], "duty_cycle_sp"), drive)
+            write(os.path.join(motors[MOTOR_PORTS.index(motor["port"])], "command"), "run-direct")
+
+    st = perf_counter()
+    while duration is None or perf_counter() - st < duration:
+
+        for n, directory in enumerate(motors):
+            index = str(n)
+            command = read(os.path.join(directory, "command"), COMMANDS)
+            duty = read(os.path.join(directory, "duty_cycle_sp"))
+            if command is not None:
+                write(os.path.join(directory, "command"), command)
+            world.write("duty_cycle_sp", index, str(duty if duty is not None and command == "run-direct" else 0))
+
+        for n, directory in enumerate(sensors):
+            index = str(n)
+            mode = read(os.path.join(directory, "mode"), MODES)
+            if mode is not None:
+                write(os.path.join(directory, "mode"), mode)
+                world.write("mode", index, mode.encode())
+            if index in world.gyros:
+                write(os.path.join(directory, "value0"), world.value("value0", index))
+                write(os.path.join(directory, "value1"), world.value("value1", index))
+            else:
+                write(os.path.join(directory, "value0"), round(50 + 40*sin(perf_counter() - st + n)))
+
+        for n in range(len(MOTOR_PORTS)):
+            write(os.path.join(iio, f"in_count{n}_raw"), world.value("count", str(n)))
+            write(os.path.join(iio, f"in_frequency{n}_input"), world.value("frequency", str(n)))
+
+        sleep(1/rate)
+
+
+def start(root, config, rate=200, drive=0):
+    """
+    Builds a tree and animates it in another process.
+    Parameters:
+        root: str
+        config: dict - Robot config
+        rate: float - Updates per second
+        drive: int - Duty cycle the drive motors start at
+    Returns:
+        process: multiprocessing.Process - Daemon, terminate it when done
+    """
+    build(root, config)
+    process = Process(target=animate, args=(root, config, rate, None, drive), daemon=True)
+    process.start()
+    return process
+
+
+def main():
+
+    parser = ArgumentParser(description="Builds and animates a fake ev3dev sysfs tree, "
+                                        "run the robot code with EV3_SYSFS_ROOT set to the root.")
+    parser.add_argument("root", help="Tree root")
+    parser.add_argument("--config", default=CONFIG, help="Robot config")
+    parser.add_argument("--rate", type=float, default=200, help="Updates per second")
+    parser.add_argument("--duration", type=float, default=None, help="Seconds to animate, until killed by default")
+    parser.add_argument("--drive", type=int, default=0, help="Duty cycle the drive motors start at")
+    parser.add_argument("--static", action="store_true", help="Only build the tree")
+    args = parser.parse_args()
+
+    with open(args.config, 'r') as f:
+        config = loads(f.read())
+
+    build(args.root, config)
+    print(f"Built sysfs tree in {args.root}")
+
+    if not args.static:
+        try:
+            animate(args.root, config, args.rate, args.duration, args.drive)
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+from struct import calcsize, unpack
+import sys
+
+# Binary run log format, must match Robot/logger.py
+MAGIC = b'FLLL'
+VERSION = 1
+COLUMNS = ('time', 'spline', 'x', 'y', 'theata', 'speedL', 'speedR', 'Vl', 'Vr')
+HEADER = '<4sHHII'
+
+
+def readLog(filename):
+    """
+    Reads a binary run log.
+    Parameters:
+        filename: str
+    Returns:
+        log: dict - Column name to list of values
+        dropped: int - Samples overwritten by the ring buffer
+    """
+    with open(filename, 'rb') as f:
+        magic, version, columns, samples, dropped = unpack(HEADER, f.read(calcsize(HEADER)))
+        if magic != MAGIC or version != VERSION or columns != len(COLUMNS):
+            raise ValueError(f"Not a run log: {filename}")
+
+        log = {name: list(unpack(f'<{samples}f', f.read(samples*4))) for name in COLUMNS}
+
+    return log, dropped
+
+
+def main():
+
+    log, dropped = readLog(sys.argv[1])
+    if dropped:
+        print(f"# {dropped} samples dropped", file=sys.stderr)
+
+    print(",".join(COLUMNS))
+    for row in zip(*log.values()):
+        print(",".join(str(value) for value in row))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,379 @@
+from argparse import ArgumentParser
+from math import cos, sin, exp, degrees
+from threading import Lock
+from types import ModuleType
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ROBOT = os.path.join(ROOT, "Robot")
+CONFIG = os.path.join(ROBOT, "config.json")
+PATHS = os.path.join(ROBOT, "Paths")
+
+# Largest integration step of the model in seconds
+STEP = 0.001
+
+
+class VirtualClock:
+    """
+    Clock that runs faster than real time.
+    Replaces time.time, time.perf_counter and time.sleep, so every thread
+    of the robot code (Rate, Timer, sleep) runs on the same scaled clock.
+    Parameters:
+        scale: float - Virtual seconds per real second
+    """
+
+    def __init__(self, scale):
+        self.scale = scale
+        self._perf_counter = time.perf_counter
+        self._sleep = time.sleep
+        self.origin = self._perf_counter()
+        self.epoch = time.time()
+
+    def now(self):
+        """
+        Returns:
+            now: float - Virtual seconds since the clock was created
+        """
+        return (self._perf_counter() - self.origin)*self.scale
+
+    def time(self):
+        return self.epoch + self.now()
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            self._sleep(seconds/self.scale)
+
+    def install(self):
+        """
+        Installs the clock, must be called before the robot modules are imported.
+        """
+        time.time = self.time
+        time.perf_counter = self.now
+        time.sleep = self.sleep
+
+
+class MotorModel:
+    """
+    First order model of a motor, driven by its ff constants.
+    The duty cycle above Ks sets the steady state speed (duty - Ks)/Kv,
+    the speed approaches it with the time constant Ka/Kv.
+    Parameters:
+        ff: list - Ks, Kv, Ka
+    """
+
+    def __init__(self, ff):
+        self.Ks, self.Kv, self.Ka = ff
+        self.tau = self.Ka/self.Kv
+        self.duty = 0
+        self.speed = 0
+        self.angle = 0
+
+    def step(self, dt):
+        """
+        Parameters:
+            dt: float - Time step in seconds
+        Returns:
+            distance: float - Degrees turned
+        """
+        if abs(self.duty) > self.Ks:
+            target = (self.duty - self.Ks*(1 if self.duty > 0 else -1))/self.Kv
+        else:
+            target = 0
+        speed = target + (self.speed - target)*exp(-dt/self.tau)
+        distance = (self.speed + speed)/2*dt
+        self.speed = speed
+        self.angle += distance
+        return distance
+
+
+class World:
+    """
+    Differential drive robot on a plane.
+    Integrates the motor models and the robot pose up to the virtual clock on every access,
+    and serves the sysfs attributes of the devices from them.
+    Raw values follow ev3dev: 2 counts per degree, gyro angle in degrees, reflect 0-100.
+    Parameters:
+        config: dict - Robot config
+        clock: VirtualClock
+        reflect: int - Light sensors reading
+    """
+
+    def __init__(self, config, clock, reflect=50):
+
+        self.clock = clock
+        self.lock = Lock()
+        self.t = clock.now()
+
+        # Tacho motor and iio channel n is port n ('A' is 0)
+        self.motors = {}
+        for motor in (config["drivebase"]["motor"]["left"], config["drivebase"]["motor"]["right"],
+                      config["motors"]["left"], config["motors"]["right"]):
+            self.motors[str(ord(motor["port"]) - ord('A'))] = MotorModel(motor["ff"])
+
+        left, right = config["drivebase"]["motor"]["left"], config["drivebase"]["motor"]["right"]
+        self.left = self.motors[str(ord(left["port"]) - ord('A'))]
+        self.right = self.motors[str(ord(right["port"]) - ord('A'))]
+        self.dirL, self.dirR = left["direction"], right["direction"]
+
+        # Sensor n is port n+1
+        self.gyros = {str(int(gyro["port"]) - 1): gyro["direction"] for gyro in config["gyro"].values()}
+        self.lights = {str(int(light["port"]) - 1) for light in config["light"].values()}
+        self.modes = {}
+        self.reflect = reflect
+
+        self._k = config["wheel"]["circumference"]/360
+        self._DBM = config["drivebase"]["DBM"]
+
+        self.x = self.y = self.theata = 0
+        self.omega = 0
+
+    def reset(self, x, y, theata):
+        """
+        Places the robot.
+        """
+        with self.lock:
+            self.advance()
+            self.x, self.y, self.theata = x, y, theata
+
+    def advance(self):
+        """
+        Integrates the model up to now, call with the lock held.
+        """
+        now = self.clock.now()
+        while self.t < now:
+            dt = min(STEP, now - self.t)
+            self.t += dt
+
+            for motor in self.motors.values():
+                if motor is not self.left and motor is not self.right:
+                    motor.step(dt)
+
+            # Wheel travel in cm, a motor's direction maps its counts to the wheel
+            dL = self.dirL*self.left.step(dt)*self._k
+            dR = self.dirR*self.right.step(dt)*self._k
+            dTheata = (dR - dL)/self._DBM
+            mid = self.theata + dTheata/2
+            self.x += (dL + dR)/2*cos(mid)
+            self.y += (dL + dR)/2*sin(mid)
+            self.theata += dTheata
+            self.omega = dTheata/dt
+
+    def value(self, kind, index):
+        """
+        Returns the value of a sysfs attribute.
+        Parameters:
+            kind: str - Attribute name
+            index: str - Device number
+        Returns:
+            value: int
+        """
+        with self.lock:
+            self.advance()
+            if kind == "count":
+                return round(self.motors[index].angle*2)
+            if kind == "frequency":
+                return round(self.motors[index].speed*2)
+            if index in self.lights:
+                return self.reflect
+
+            direction = self.gyros[index]
+            mode = self.modes.get(index, "GYRO-ANG")
+            angle, rate = degrees(self.theata)*direction, degrees(self.omega)*direction
+            if mode == "GYRO-RATE" or (mode == "GYRO-G&A" and kind == "value1"):
+                return round(rate)
+            if mode == "GYRO-CAL":
+                return 0
+            return round(angle)
+
+    def write(self, kind, index, data):
+        """
+        Writes a sysfs attribute.
+        Parameters:
+            kind: str - Attribute name
+            index: str - Device number
+            data: bytes
+        """
+        with self.lock:
+            self.advance()
+            if kind == "duty_cycle_sp":
+                self.motors[index].duty = max(-100, min(100, int(data)))
+            elif kind == "command":
+                if data.strip() in (b"stop", b"reset"):
+                    self.motors[index].duty = 0
+            elif kind == "mode":
+                self.modes[index] = data.decode().strip()
+
+    def reader(self, path, size=16):
+        """
+        Returns a SysfsReader for a device attribute.
+        """
+        return SimReader(self, *attribute(path))
+
+    def writer(self, path):
+        """
+        Returns a SysfsWriter for a device attribute.
+        """
+        return SimWriter(self, *attribute(path))
+
+
+def attribute(path):
+    """
+    Splits a sysfs path to the attribute and the device number.
+    Parameters:
+        path: str - e.g. '/sys/bus/iio/devices/iio:device1/in_count0_raw'
+    Returns:
+        kind: str - count, frequency, duty_cycle_sp, command, value0, value1 or mode
+        index: str
+    """
+    directory, name = path.rsplit('/', 1)
+    if name.startswith("in_count"):
+        return "count", name[len("in_count"):-len("_raw")]
+    if name.startswith("in_frequency"):
+        return "frequency", name[len("in_frequency"):-len("_input")]
+    device = directory.rsplit('/', 1)[1]
+    return name, device.lstrip("motorsen")
+
+
+class SimReader:
+    """
+    SysfsReader of a simulated attribute.
+    """
+
+    def __init__(self, world, kind, index):
+        self.world, self.kind, self.index = world, kind, index
+        self.last = 0
+
+    def read(self):
+        self.last = self.world.value(self.kind, self.index)
+        return self.last
+
+    def close(self):
+        pass
+
+
+class SimWriter:
+    """
+    SysfsWriter of a simulated attribute.
+    """
+
+    def __init__(self, world, kind, index):
+        self.world, self.kind, self.index = world, kind, index
+
+    def write(self, data):
+        self.world.write(self.kind, self.index, data)
+
+    def close(self):
+        pass
+
+
+def micropythonModule():
+    """
+    Returns a micropython module for CPython, the decorators and const are no-ops.
+    """
+    module = ModuleType("micropython")
+    module.native = module.viper = lambda func: func
+    module.const = lambda value: value
+    module.opt_level = lambda *args: None
+    return module
+
+
+def install(world):
+    """
+    Imports the robot's ev3devices on the simulated devices.
+    The devices keep all their logic, only their sysfs attributes are served by the world.
+    Parameters:
+        world: World
+    """
+    # ev3devices scans /sys for the ports on import, there is nothing to scan
+    listdir = os.listdir
+    os.listdir = lambda path='.': [] if "/sys/class/" in path else listdir(path)
+    try:
+        import ev3devices
+    finally:
+        os.listdir = listdir
+    ev3devices.listdir = listdir
+
+    for port, props in ev3devices.motor_ports.items():
+        props[1] = props[0]
+    for port in ev3devices.sensor_ports:
+        ev3devices.sensor_ports[port] = str(int(port) - 1)
+
+    ev3devices.SysfsReader = world.reader
+    ev3devices.SysfsWriter = world.writer
+
+    class Motor(ev3devices.Motor):
+        def connected(self): return ord(self._port) - ord('A') < 4
+
+    class Gyro(ev3devices.Gyro):
+        def connected(self): return self._portF in world.gyros
+
+    class LightSensor(ev3devices.LightSensor):
+        def connected(self): return self._portF in world.lights
+
+    # DualGyro and the modules imported after this use the simulated classes
+    ev3devices.Motor, ev3devices.Gyro, ev3devices.LightSensor = Motor, Gyro, LightSensor
+
+
+def main():
+
+    parser = ArgumentParser(description="Runs a path on a simulated robot, faster than real time.")
+    parser.add_argument("name", help="Path name")
+    parser.add_argument("b", type=float, nargs="?", default=0.025, help="RAMSETE b, in cm like the Handler's gains")
+    parser.add_argument("zeta", type=float, nargs="?", default=0.7, help="RAMSETE zeta")
+    parser.add_argument("--config", default=CONFIG, help="Robot config")
+    parser.add_argument("--paths", default=PATHS, help="Path files directory")
+    parser.add_argument("--scale", type=float, default=4, help="Virtual seconds per real second")
+    parser.add_argument("--reflect", type=int, default=50, help="Light sensors reading")
+    parser.add_argument("--log", default=None, help="Run log, runtime<name>.log by default")
+    args = parser.parse_args()
+
+    from json import loads
+    with open(args.config, 'r') as f:
+        robotConfig = loads(f.read())
+
+    sys.path.insert(0, ROBOT)
+    sys.modules.setdefault("micropython", micropythonModule())
+
+    clock = VirtualClock(args.scale)
+    clock.install()
+
+    world = World(robotConfig, clock, args.reflect)
+    install(world)
+
+    import runner
+    from config import config
+    runner.PATHS = os.path.join(args.paths, "")
+
+    robot = runner.Runner(config(args.config))
+
+    x, y, theata = robot.load(args.name).get(0).getStart()
+    world.reset(x, y, theata)
+
+    robot.drivebase.update()
+
+    st, vt = clock._perf_counter(), clock.now()
+    log, counter = robot.path(args.name, args.b, args.zeta, True)
+    real, virtual = clock._perf_counter() - st, clock.now() - vt
+
+    robot.exit()
+    robot.actuators.stop()
+    robot.sensors.stop()
+
+    filename = args.log or "runtime{}.log".format(args.name)
+    log.dump(filename)
+    # The dump runs on a thread and holds the lock until the file is written
+    with log.lock:
+        pass
+    print(robot.latency)
+
+    odometry = robot.odometry.getPos2d()
+    print("Ran {:.2f}s in {:.2f}s ({:.1f}x), {} control loops".format(virtual, real, virtual/real, counter))
+    print("Robot:    x: {:.2f} y: {:.2f} theata: {:.2f}".format(world.x, world.y, degrees(world.theata) % 360))
+    print("Odometry: x: {:.2f} y: {:.2f} theata: {:.2f}".format(odometry[0], odometry[1], degrees(odometry[2])))
+    print("Run log:", filename)
+
+
+if __name__ == "__main__":
+    main()